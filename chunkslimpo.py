@@ -4,14 +4,23 @@
 Extrator de PDF para Chunks de Contexto - Versão Corrigida
 """
 
+import argparse
+import copy
+import hashlib
 import json
+import logging
+import os
 import sys
 import re
+from bisect import bisect_right
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-import datetime
+from datetime import datetime
 import pyodbc
 import pandas as pd
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Iterable, Iterator, Tuple
+from dataclasses import dataclass, field
 
 # Verificar PyMuPDF
 try:
@@ -21,6 +30,120 @@ except ImportError:
     print("Execute: pip install PyMuPDF")
     sys.exit(1)
 
+# orjson é opcional: serializa bem mais rápido; sem ele usamos json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Progresso por página/bloco vai para o logger (DEBUG) para não travar o stdout
+logger = logging.getLogger(__name__)
+
+# Fim de frase usado para alinhar a sobreposição entre chunks
+_SENTENCE_BREAK_RE = re.compile(r'[.!?]\s+')
+
+# Palavras-chave sem distinção de maiúsculas: dispensa a cópia via .upper().
+# IGNORECASE não expande ligaduras como .upper() fazia ("ﬁ" -> "FI", "ﬆ" -> "ST"),
+# então as que aparecem nas palavras-chave entram como alternativas explícitas.
+_CONFIDENTIAL_PATTERN = r'CON(?:FI|\ufb01)DENTIAL'
+_INVESTMENT_PATTERN = r'INVE(?:ST|\ufb05|\ufb06)MENT'
+_HEADING_KEYWORDS_RE = re.compile(_CONFIDENTIAL_PATTERN + r'|MEMORANDUM|FUND|NOTICE|REGULATORY', re.IGNORECASE)
+# Seções numa única alternação: um grupo por seção, em ordem de prioridade
+_SECTION_KEYWORDS_RE = re.compile(
+    r'(?P<document_header>' + _CONFIDENTIAL_PATTERN + r'|MEMORANDUM)'
+    r'|(?P<risk_section>RISK|WARNING|CAUTION)'
+    r'|(?P<investment_section>' + _INVESTMENT_PATTERN + r'|FUND|PORTFOLIO)'
+    r'|(?P<legal_section>LEGAL|REGULATORY|COMPLIANCE)',
+    re.IGNORECASE
+)
+_SECTION_PRIORITY = {name: i for i, name in enumerate(_SECTION_KEYWORDS_RE.groupindex)}
+_FINANCIAL_RE = re.compile(r'\d+\.\d+%|\$\d+|USD|EUR')
+_SECTION_SCAN_CHARS = 2048  # Contexto de seção é heurístico: basta o início do bloco
+
+# Classificação de blocos em lote: os textos de uma página são unidos por um
+# separador e cada família de padrões é buscada uma vez no texto completo.
+# O separador é espaço em branco, que a limpeza já normalizou nos blocos.
+_BLOCK_SEPARATOR = "\x1e"
+_NUMBER_TOKEN_RE = re.compile(r'\b\d+\b')
+_TABLE_SPACING_RE = re.compile(r'\t|  ')
+_LIST_ITEM_RE = re.compile(r'\s*(?:[-•▪▫]|\d+\.)\s+')
+_LIST_ITEM_FIRST_CHARS = frozenset('-•▪▫0123456789')  # Pré-filtro antes do regex de lista
+_FOOTNOTE_PREFIXES = ('*', 'Note:')
+
+# Conteúdo inútil: separadores, números de página, letras ou barras isoladas
+_USELESS_BLOCK_RE = re.compile(
+    r'(?:[-_=*+~#\s]*'      # Só caracteres de separação
+    r'|\d+\s*'              # Só números (páginas)
+    r'|page\s+\d+\s*'       # "page 1"
+    r'|[a-z]\s*'            # Uma letra só
+    r'|\s*\|\s*'            # Só pipes
+    r'|\s*\\\s*'            # Só barras
+    r'|\s*/\s*)$'           # Só barras
+)
+
+# Pontuação considerada ruído; translate remove tudo numa passada em C
+_PUNCT_DELETE = str.maketrans('', '', '.,;:!?-_=*+~#()[]{}|\\/')
+_PUNCT_PREFIX_LEN = 256  # Prefixo usado no pré-filtro de pontuação
+_OUTPUT_BUFFER_SIZE = 1 << 20  # Buffer de escrita do JSON de saída (1 MiB)
+
+
+@dataclass(slots=True)
+class ChunkMetadata:
+    """Metadados de um chunk de conteúdo"""
+    pages: List[int] = field(default_factory=list)
+    elements: List[str] = field(default_factory=list)
+    visual_elements: Dict[str, bool] = field(default_factory=dict)
+    content_types: Any = field(default_factory=set)  # set na montagem, lista ordenada ao finalizar
+    word_count: int = 0
+    char_count: int = 0
+    content_hash: str = ""  # blake2b do conteúdo, para cache de embeddings a jusante
+
+
+@dataclass(slots=True)
+class ChunkContext:
+    """Contexto de navegação de um chunk"""
+    previous_chunk_summary: str = ""
+    section_context: str = ""
+    document_position: float = 0.0  # Fração do documento (0.25 = ~25%)
+    chunk_position: int = 0  # Índice do chunk (1..summary.total_chunks)
+    previous_chunk_id: Optional[str] = None
+    next_chunk_id: Optional[str] = None
+
+
+@dataclass(slots=True)
+class ContentChunk:
+    """Chunk de conteúdo; convertido para dict apenas na gravação do JSON"""
+    id: str = ""
+    content: str = ""
+    metadata: ChunkMetadata = field(default_factory=ChunkMetadata)
+    context: ChunkContext = field(default_factory=ChunkContext)
+
+    def to_dict(self) -> Dict[str, Any]:
+        """Converte para dict uma única vez, na gravação (sem a cópia profunda do asdict)."""
+        meta, ctx = self.metadata, self.context
+        return {
+            "id": self.id,
+            "content": self.content,
+            "metadata": {
+                "pages": meta.pages,
+                "elements": meta.elements,
+                "visual_elements": meta.visual_elements,
+                "content_types": meta.content_types,
+                "word_count": meta.word_count,
+                "char_count": meta.char_count,
+                "content_hash": meta.content_hash,
+            },
+            "context": {
+                "previous_chunk_summary": ctx.previous_chunk_summary,
+                "section_context": ctx.section_context,
+                "document_position": ctx.document_position,
+                "chunk_position": ctx.chunk_position,
+                "previous_chunk_id": ctx.previous_chunk_id,
+                "next_chunk_id": ctx.next_chunk_id,
+            },
+        }
+
 
 class PDFToChunksExtractor:
     """Extrator de PDF em chunks contextuais para LLM com integração SQL."""
@@ -29,6 +152,8 @@ class PDFToChunksExtractor:
         self.chunk_size = chunk_size
         self.overlap = overlap
         self.min_chunk_size = 100
+        self.min_page_text = 50  # Abaixo disso, página com imagens é tratada como scan
+        self.parallel_min_pages = 16  # PDFs menores não compensam o custo do pool
     
     @staticmethod
     def get_data_from_sql(query):
@@ -181,23 +306,18 @@ class PDFToChunksExtractor:
         
         content_clean = content.strip().lower()
         
-        # Padrões de conteúdo inútil
-        useless_patterns = [
-            r'^[-_=*+~#\s]*$',           # Só caracteres de separação
-            r'^\d+\s*$',                 # Só números (páginas)
-            r'^page\s+\d+\s*$',          # "page 1"
-            r'^[a-z]\s*$',               # Uma letra só
-            r'^\s*\|\s*$',               # Só pipes
-            r'^\s*\\\s*$',               # Só barras
-            r'^\s*\/\s*$',               # Só barras
-        ]
-        
-        if any(re.match(pattern, content_clean) for pattern in useless_patterns):
+        if _USELESS_BLOCK_RE.match(content_clean):
             return True
         
-        # Ignorar se é principalmente pontuação
-        punct_count = sum(1 for c in content_clean if c in '.,;:!?-_=*+~#()[]{}|\\/')
-        if punct_count > len(content_clean) * 0.7:  # Mais de 70% pontuação
+        # Ignorar se é principalmente pontuação (mais de 70%)
+        max_punct = len(content_clean) * 0.7
+        # Pré-filtro: se o texto do prefixo já basta, o bloco não é só pontuação
+        prefix_text = len(content_clean[:_PUNCT_PREFIX_LEN].translate(_PUNCT_DELETE))
+        if len(content_clean) - prefix_text <= max_punct:
+            return False
+        
+        punct_count = len(content_clean) - len(content_clean.translate(_PUNCT_DELETE))
+        if punct_count > max_punct:
             return True
         
         return False
@@ -304,8 +424,17 @@ class PDFToChunksExtractor:
         return None
     
     @staticmethod
-    def extract_document_metadata(doc, fund_identifier: str = None, map_id: int = None) -> Dict[str, Any]:
-        """Extrai metadados do documento com integração SQL."""
+    def extract_document_metadata(doc, fund_identifier: str = None, map_id: int = None,
+                                  use_cache: bool = True,
+                                  extraction_timestamp: Optional[str] = None) -> Dict[str, Any]:
+        """Extrai metadados do documento com integração SQL.
+        
+        Com use_cache, a consulta do fundo é memorizada por (identificador, MapID)
+        durante o processo, evitando repetir a query em lotes do mesmo fundo.
+        extraction_timestamp permite reaproveitar o horário já calculado pelo chamador.
+        """
+        if extraction_timestamp is None:
+            extraction_timestamp = datetime.now().isoformat(timespec='seconds')
         
         try:
             # Metadados básicos do PDF
@@ -319,13 +448,13 @@ class PDFToChunksExtractor:
                 "creation_date": metadata.get("creationDate", ""),
                 "modification_date": metadata.get("modDate", ""),
                 "total_pages": len(doc),
-                "extraction_timestamp": str(datetime.datetime.now())
+                "extraction_timestamp": extraction_timestamp
             }
         except Exception as e:
             basic_metadata = {
                 "error": str(e),
                 "total_pages": len(doc),
-                "extraction_timestamp": str(datetime.datetime.now())
+                "extraction_timestamp": extraction_timestamp
             }
         
         # Priorizar MapID, depois fund_identifier, depois auto-detectar
@@ -337,7 +466,11 @@ class PDFToChunksExtractor:
         
         # Buscar informações no SQL
         print("Buscando informações do fundo no SQL...")
-        sql_info = PDFToChunksExtractor.get_fund_info_from_sql(search_text, search_id)
+        if use_cache:
+            # Cópia para que alterações do chamador não contaminem o cache
+            sql_info = copy.deepcopy(_lookup_fund(search_text, search_id))
+        else:
+            sql_info = PDFToChunksExtractor.get_fund_info_from_sql(search_text, search_id)
         
         # Combinar metadados
         combined_metadata = {
@@ -350,7 +483,7 @@ class PDFToChunksExtractor:
     def extract_page_elements(self, doc, page_num: int) -> Dict[str, Any]:
         """Extrai todos os elementos de uma página."""
         page = doc[page_num]
-        print(f"Analisando página {page_num + 1}")
+        logger.debug("Analisando página %d", page_num + 1)
         
         elements = {
             "page_number": page_num + 1,
@@ -370,16 +503,32 @@ class PDFToChunksExtractor:
         }
         
         # 1. EXTRAIR TEXTO BRUTO
+        raw_text = ""
         try:
             raw_text = page.get_text()
             # Aplicar limpeza ao texto bruto
             cleaned_text = self.clean_extracted_text(raw_text)
             elements["text_content"] = cleaned_text
-            print(f"Texto extraído: {len(cleaned_text.split())} palavras (após limpeza)")
+            if logger.isEnabledFor(logging.DEBUG):
+                logger.debug("Texto extraído: %d palavras (após limpeza)", len(cleaned_text.split()))
         except Exception as e:
             print(f"Erro na extração de texto: {e}")
             elements["text_content"] = f"[ERRO NA EXTRAÇÃO: {e}]"
 
+        try:
+            images = page.get_images(full=True)
+        except Exception as e:
+            print(f"Erro na detecção de imagens: {e}")
+            images = []
+
+        # Página só de imagem (scan/gráficos): pular blocos estruturados e tabelas
+        if len(raw_text.strip()) < self.min_page_text and images:
+            logger.debug("Página %d sem texto útil, apenas imagens", page_num + 1)
+            elements["skipped_reason"] = "image_only"
+            page = None  # Libera a página no MuPDF antes de ler as imagens
+            self._process_page_images(doc, images, page_num, elements)
+            return elements
+
         # 2. EXTRAIR BLOCOS ESTRUTURADOS
         try:
             text_dict = page.get_text("dict")
@@ -408,14 +557,12 @@ class PDFToChunksExtractor:
                         
                         # Verificar se deve pular o bloco por ser inútil
                         if self.should_skip_block(cleaned_block_content):
-                            print(f"Pulando bloco inútil: '{block_text[:50]}...'")
+                            logger.debug("Pulando bloco inútil: '%s...'", block_text[:50])
                             continue
                         
-                        block_type = self._classify_block_type(cleaned_block_content, font_info)
-                        
                         structured_block = {
                             "id": f"page_{page_num + 1}_block_{i + 1}",
-                            "type": block_type,
+                            "type": None,  # Preenchido na classificação em lote abaixo
                             "content": cleaned_block_content,
                             "bbox": block.get("bbox", []),
                             "font_info": font_info[0] if font_info else {},
@@ -426,15 +573,36 @@ class PDFToChunksExtractor:
                         }
                         
                         elements["structured_blocks"].append(structured_block)
+            
+            structured_blocks = elements["structured_blocks"]
+            block_types = self._classify_blocks([b["content"] for b in structured_blocks])
+            for structured_block, block_type in zip(structured_blocks, block_types):
+                structured_block["type"] = block_type
 
         except Exception as e:
             print(f"Erro na extração estruturada: {e}")
+        
+        # Página e dict do MuPDF não são mais usados: liberar já, não no fim
+        page = text_dict = None
 
         # 3. DETECTAR IMAGENS
+        self._process_page_images(doc, images, page_num, elements)
+
+        # 4. DETECTAR TABELAS
+        try:
+            tables = self._detect_tables(elements["text_content"])
+            elements["tables"] = tables
+            if tables:
+                elements["visual_elements"]["has_tables"] = True
+                logger.debug("Tabelas detectadas: %d", len(tables))
+        except Exception as e:
+            print(f"Erro na detecção de tabelas: {e}")
+
+        return elements
+
+    def _process_page_images(self, doc, images: List, page_num: int, elements: Dict[str, Any]):
+        """Extrai informações das imagens da página e marca elementos visuais."""
         try:
-            images = page.get_images(full=True)
-            elements["images"] = []
-            
             for i, img in enumerate(images):
                 try:
                     img_data = doc.extract_image(img[0])
@@ -463,50 +631,66 @@ class PDFToChunksExtractor:
                         "error": str(img_error)
                     })
             
-            print(f"Imagens processadas: {len(elements['images'])}")
+            logger.debug("Imagens processadas: %d", len(elements["images"]))
 
         except Exception as e:
             print(f"Erro na detecção de imagens: {e}")
 
-        # 4. DETECTAR TABELAS
-        try:
-            tables = self._detect_tables(elements["text_content"])
-            elements["tables"] = tables
-            if tables:
-                elements["visual_elements"]["has_tables"] = True
-                print(f"Tabelas detectadas: {len(tables)}")
-        except Exception as e:
-            print(f"Erro na detecção de tabelas: {e}")
-
-        return elements
-
-    def _classify_block_type(self, text: str, font_info: List[Dict]) -> str:
-        """Classifica o tipo de bloco baseado no conteúdo e formatação."""
-        text_upper = text.upper()
-        
-        if any(keyword in text_upper for keyword in 
-               ["CONFIDENTIAL", "MEMORANDUM", "FUND", "NOTICE", "REGULATORY"]):
-            return "heading"
-        
-        if re.match(r'^\s*[-•▪▫]\s+', text) or re.match(r'^\s*\d+\.\s+', text):
-            return "list_item"
+    def _classify_blocks(self, texts: List[str]) -> List[str]:
+        """Classifica o tipo de cada bloco de uma página numa única passada.
         
-        if len(re.findall(r'\b\d+\b', text)) > 3 and ('\t' in text or '  ' in text):
-            return "table_data"
-        
-        if len(text) < 200 and (text.startswith('*') or text.startswith('Note:')):
-            return "footnote"
+        Cada família de padrões percorre o texto unido uma vez; a posição de
+        cada ocorrência identifica o bloco de origem.
+        """
+        if not texts:
+            return []
         
-        if len(text) > 100:
-            return "paragraph"
+        starts = []
+        offset = 0
+        for text in texts:
+            starts.append(offset)
+            offset += len(text) + len(_BLOCK_SEPARATOR)
+        joined = _BLOCK_SEPARATOR.join(texts)
+        
+        has_keyword = [False] * len(texts)
+        for match in _HEADING_KEYWORDS_RE.finditer(joined):
+            has_keyword[bisect_right(starts, match.start()) - 1] = True
+        
+        number_counts = [0] * len(texts)
+        for match in _NUMBER_TOKEN_RE.finditer(joined):
+            number_counts[bisect_right(starts, match.start()) - 1] += 1
+        
+        has_spacing = [False] * len(texts)
+        for match in _TABLE_SPACING_RE.finditer(joined):
+            has_spacing[bisect_right(starts, match.start()) - 1] = True
+        
+        block_types = []
+        for i, text in enumerate(texts):
+            if has_keyword[i]:
+                block_types.append("heading")
+            elif text.lstrip()[:1] in _LIST_ITEM_FIRST_CHARS and _LIST_ITEM_RE.match(text):
+                block_types.append("list_item")
+            elif number_counts[i] > 3 and has_spacing[i]:
+                block_types.append("table_data")
+            elif len(text) < 200 and text.startswith(_FOOTNOTE_PREFIXES):
+                block_types.append("footnote")
+            elif len(text) > 100:
+                block_types.append("paragraph")
+            else:
+                block_types.append("text_block")
         
-        return "text_block"
+        return block_types
 
     def _classify_image_type(self, img_data: Dict) -> str:
         """Classifica o tipo de imagem baseado nas características."""
         width = img_data.get("width", 0)
         height = img_data.get("height", 0)
         pixels = width * height
+        
+        # Ícones (logos, marcadores) saem só com comparação de inteiros
+        if pixels < 20000:
+            return "icon"
+        
         aspect_ratio = width / height if height > 0 else 1
         
         if (pixels > 50000 and 
@@ -517,9 +701,6 @@ class PDFToChunksExtractor:
         if pixels > 20000 and aspect_ratio > 2.5:
             return "diagram"
         
-        if pixels < 20000:
-            return "icon"
-        
         return "image"
 
     def _detect_tables(self, text: str) -> List[Dict]:
@@ -573,34 +754,26 @@ class PDFToChunksExtractor:
         
         return tables
 
-    def create_content_chunks(self, all_elements: List[Dict]) -> List[Dict]:
-        """Cria chunks de conteúdo mantendo contexto semântico."""
-        print("Criando chunks de conteúdo...")
+    def iter_content_chunks(self, pages: Iterable[Dict], total_pages: int) -> Iterator[ContentChunk]:
+        """Gera chunks de conteúdo, um por vez, mantendo contexto semântico.
+        
+        As páginas podem vir de um gerador: cada chunk é emitido assim que
+        fecha, já com previous/next_chunk_id, e só o chunk corrente (com a
+        sobreposição) fica em memória. chunk_position é o índice do chunk (o
+        total vai no summary); document_position é a fração das páginas
+        anteriores à página onde o chunk começa.
+        """
+        logger.info("Criando chunks de conteúdo...")
         
-        chunks = []
-        current_chunk = {
-            "id": "",
-            "content": "",
-            "metadata": {
-                "pages": [],
-                "elements": [],
-                "visual_elements": {},
-                "content_types": [],
-                "word_count": 0,
-                "char_count": 0
-            },
-            "context": {
-                "previous_chunk_summary": "",
-                "section_context": "",
-                "document_position": ""
-            }
-        }
+        emitted = 0
+        previous_id = None
+        current_chunk = ContentChunk()
         
         chunk_counter = 1
         
-        for page_elements in all_elements:
+        for page_elements in pages:
             page_num = page_elements["page_number"]
-            print(f"Processando página {page_num} para chunks...")
+            logger.debug("Processando página %d para chunks...", page_num)
             
             visual_context = ""
             if page_elements["images"]:
@@ -621,81 +794,88 @@ class PDFToChunksExtractor:
                     content_with_context = block_content + visual_context
                     visual_context = ""
                 
-                if (len(current_chunk["content"]) + len(content_with_context) > self.chunk_size and 
-                    len(current_chunk["content"]) > self.min_chunk_size):
+                current_len = len(current_chunk.content)
+                if (current_len + len(content_with_context) > self.chunk_size and 
+                    current_len > self.min_chunk_size):
                     
-                    self._finalize_chunk(current_chunk, chunk_counter)
-                    chunks.append(current_chunk)
+                    chunk_words = self._finalize_chunk(current_chunk, chunk_counter)
+                    emitted += 1
+                    current_chunk.context.chunk_position = emitted
+                    current_chunk.context.previous_chunk_id = previous_id
+                    # Um novo chunk sempre começa aqui, com o bloco atual
+                    current_chunk.context.next_chunk_id = f"chunk_{chunk_counter + 1}"
+                    previous_id = current_chunk.id
+                    yield current_chunk
                     
-                    overlap_content = self._get_overlap_content(current_chunk["content"])
-                    previous_summary = self._create_chunk_summary(current_chunk["content"])
+                    overlap_content = self._get_overlap_content(current_chunk.content)
+                    previous_summary = self._create_chunk_summary(current_chunk.content, chunk_words)
                     
                     chunk_counter += 1
-                    current_chunk = {
-                        "id": f"chunk_{chunk_counter}",
-                        "content": overlap_content,
-                        "metadata": {
-                            "pages": [page_num],
-                            "elements": [block["id"]],
-                            "visual_elements": page_elements["visual_elements"],
-                            "content_types": [block_type],
-                            "word_count": 0,
-                            "char_count": 0
-                        },
-                        "context": {
-                            "previous_chunk_summary": previous_summary,
-                            "section_context": self._get_section_context(block_content),
-                            "document_position": f"~{len(chunks) * 100 / len(all_elements):.0f}% do documento"
-                        }
-                    }
+                    current_chunk = ContentChunk(
+                        id=f"chunk_{chunk_counter}",
+                        content=overlap_content,
+                        metadata=ChunkMetadata(
+                            pages=[page_num],
+                            elements=[block["id"]],
+                            visual_elements=page_elements["visual_elements"],
+                            content_types={block_type}
+                        ),
+                        context=ChunkContext(
+                            previous_chunk_summary=previous_summary,
+                            section_context=self._get_section_context(block_content),
+                            document_position=round((page_num - 1) / max(total_pages, 1), 4)
+                        )
+                    )
                 
-                if current_chunk["content"]:
-                    current_chunk["content"] += "\n\n"
-                current_chunk["content"] += content_with_context
+                if current_chunk.content:
+                    current_chunk.content += "\n\n"
+                current_chunk.content += content_with_context
                 
-                if page_num not in current_chunk["metadata"]["pages"]:
-                    current_chunk["metadata"]["pages"].append(page_num)
-                current_chunk["metadata"]["elements"].append(block["id"])
-                if block_type not in current_chunk["metadata"]["content_types"]:
-                    current_chunk["metadata"]["content_types"].append(block_type)
-        
-        if current_chunk["content"].strip():
+                # Páginas chegam em ordem: basta comparar com a última
+                chunk_pages = current_chunk.metadata.pages
+                if not chunk_pages or chunk_pages[-1] != page_num:
+                    chunk_pages.append(page_num)
+                current_chunk.metadata.elements.append(block["id"])
+                current_chunk.metadata.content_types.add(block_type)
+        
+        if current_chunk.content.strip():
             self._finalize_chunk(current_chunk, chunk_counter)
-            chunks.append(current_chunk)
-        
-        print(f"Criados {len(chunks)} chunks de conteúdo")
-        
-        for i, chunk in enumerate(chunks):
-            chunk["context"]["chunk_position"] = f"{i + 1}/{len(chunks)}"
-            if i > 0:
-                chunk["context"]["previous_chunk_id"] = chunks[i - 1]["id"]
-            if i < len(chunks) - 1:
-                chunk["context"]["next_chunk_id"] = chunks[i + 1]["id"]
-        
-        return chunks
+            current_chunk.context.chunk_position = emitted + 1
+            current_chunk.context.previous_chunk_id = previous_id
+            yield current_chunk
 
-    def _finalize_chunk(self, chunk: Dict, chunk_id: int):
-        """Finaliza um chunk calculando metadados."""
-        chunk["id"] = f"chunk_{chunk_id}"
-        chunk["metadata"]["word_count"] = len(chunk["content"].split())
-        chunk["metadata"]["char_count"] = len(chunk["content"])
+    def _finalize_chunk(self, chunk: ContentChunk, chunk_id: int) -> List[str]:
+        """Finaliza um chunk calculando metadados.
+        
+        Retorna as palavras do chunk para o resumo reaproveitar a mesma divisão.
+        """
+        words = chunk.content.split()
+        chunk.id = f"chunk_{chunk_id}"
+        chunk.metadata.word_count = len(words)
+        chunk.metadata.char_count = len(chunk.content)
+        chunk.metadata.content_hash = hashlib.blake2b(
+            chunk.content.encode('utf-8'), digest_size=16
+        ).hexdigest()
+        chunk.metadata.content_types = sorted(chunk.metadata.content_types)
+        return words
 
     def _get_overlap_content(self, content: str) -> str:
         """Obtém conteúdo de sobreposição do chunk anterior."""
         if len(content) <= self.overlap:
             return content
         
+        # Começar na primeira frase completa dentro da janela de sobreposição
         overlap_start = len(content) - self.overlap
-        sentences = re.split(r'[.!?]\s+', content[overlap_start:])
+        match = _SENTENCE_BREAK_RE.search(content, overlap_start)
         
-        if len(sentences) > 1:
-            return '. '.join(sentences[1:]) + '.'
-        else:
-            return content[-self.overlap:]
+        if match and match.end() < len(content):
+            return content[match.end():]
+        return content[overlap_start:]
 
-    def _create_chunk_summary(self, content: str) -> str:
+    def _create_chunk_summary(self, content: str, words: Optional[List[str]] = None) -> str:
         """Cria um resumo simples do chunk anterior."""
-        words = content.split()
+        if words is None:
+            words = content.split()
         if len(words) <= 20:
             return content
         
@@ -703,165 +883,336 @@ class PDFToChunksExtractor:
         return summary
 
     def _get_section_context(self, content: str) -> str:
-        """Identifica o contexto da seção atual."""
-        content_upper = content.upper()
-        
-        if any(keyword in content_upper for keyword in ["CONFIDENTIAL", "MEMORANDUM"]):
-            return "document_header"
-        elif any(keyword in content_upper for keyword in ["RISK", "WARNING", "CAUTION"]):
-            return "risk_section"
-        elif any(keyword in content_upper for keyword in ["INVESTMENT", "FUND", "PORTFOLIO"]):
-            return "investment_section"
-        elif any(keyword in content_upper for keyword in ["LEGAL", "REGULATORY", "COMPLIANCE"]):
-            return "legal_section"
-        elif re.search(r'\d+\.\d+%|\$\d+|USD|EUR', content):
+        """Identifica o contexto da seção atual.
+        
+        A classificação é heurística e olha só os primeiros caracteres do
+        bloco, onde ficam títulos e marcadores de moeda.
+        """
+        end = _SECTION_SCAN_CHARS
+        # Uma passada só; vale a seção de maior prioridade encontrada
+        section = None
+        for match in _SECTION_KEYWORDS_RE.finditer(content, 0, end):
+            name = match.lastgroup
+            if section is None or _SECTION_PRIORITY[name] < _SECTION_PRIORITY[section]:
+                section = name
+                if _SECTION_PRIORITY[name] == 0:
+                    break
+        
+        if section is not None:
+            return section
+        elif _FINANCIAL_RE.search(content, 0, end):
             return "financial_data"
         else:
             return "general_content"
     
     def extract_to_chunks(self, file_path: str, output_dir: str = "C:/extrair", 
-                         fund_identifier: str = None, map_id: int = None) -> Dict[str, Any]:
-        """Extração principal para chunks contextuais com dados SQL."""
+                         fund_identifier: str = None, map_id: int = None,
+                         use_sql_cache: bool = True, include_raw: bool = False,
+                         page_range: Optional[tuple] = None) -> Dict[str, Any]:
+        """Extração principal para chunks contextuais com dados SQL.
+        
+        Os chunks são gravados direto no arquivo JSON; o dict retornado traz
+        apenas document_info, summary e output_file. Os elementos brutos de
+        cada página (page_elements, com bbox/fontes por bloco) só entram no
+        JSON com include_raw=True; ferramentas que dependem deles devem ativá-lo.
+        page_range=(início, fim) limita a extração às páginas [início, fim),
+        base 0, para trabalhar só com o começo de PDFs muito grandes.
+        """
         
+        # Um único horário para todo o documento (metadados e configuração)
+        extraction_timestamp = datetime.now().isoformat(timespec='seconds')
         file_path = Path(file_path)
+        path_str = os.fspath(file_path)
+        file_name = file_path.name
         output_dir = Path(output_dir)
         output_dir.mkdir(parents=True, exist_ok=True)
         
-        print(f"EXTRAÇÃO PDF PARA CHUNKS CONTEXTUAIS COM SQL")
-        print(f"Arquivo: {file_path.name}")
-        print(f"Saída: {output_dir}")
+        logger.info("EXTRAÇÃO PDF PARA CHUNKS CONTEXTUAIS COM SQL")
+        logger.info("Arquivo: %s", file_name)
+        logger.info("Saída: %s", output_dir)
         
         if map_id:
-            print(f"MapID: {map_id}")
+            logger.info("MapID: %s", map_id)
         elif fund_identifier:
-            print(f"Identificador do fundo: {fund_identifier}")
+            logger.info("Identificador do fundo: %s", fund_identifier)
         else:
-            print(f"Identificador do fundo: Auto-detectar")
+            logger.info("Identificador do fundo: Auto-detectar")
         
+        doc = None
         try:
-            doc = fitz.open(str(file_path))
-            print(f"Total de páginas: {len(doc)}")
-            
-            # 1. Extrair metadados com integração SQL
-            doc_metadata = self.extract_document_metadata(doc, fund_identifier, map_id)
+            doc = fitz.open(filename=path_str, filetype="pdf")
+            total_pages = len(doc)
+            logger.info("Total de páginas: %d", total_pages)
+            if total_pages == 0:
+                logger.warning("PDF sem páginas, nada a extrair")
+                return None
             
-            # 2. Extrair elementos de todas as páginas
-            all_elements = []
-            for page_num in range(len(doc)):
-                page_elements = self.extract_page_elements(doc, page_num)
-                all_elements.append(page_elements)
+            first_page, last_page = page_range or (0, total_pages)
+            first_page = max(0, first_page)
+            last_page = min(last_page, total_pages)
+            if page_range:
+                logger.info("Páginas selecionadas: %d a %d", first_page + 1, last_page)
             
-            # 3. Criar chunks contextuais
-            content_chunks = self.create_content_chunks(all_elements)
+            # 1. Extrair metadados com integração SQL
+            doc_metadata = self.extract_document_metadata(doc, fund_identifier, map_id, use_sql_cache,
+                                                          extraction_timestamp)
             
-            # 4. Estrutura final dos dados com informações SQL
-            extracted_data = {
-                "document_info": {
-                    "filename": file_path.name,
-                    "source_path": str(file_path),
-                    "metadata": doc_metadata,
-                    "extraction_config": {
-                        "chunk_size": self.chunk_size,
-                        "overlap": self.overlap,
-                        "extraction_timestamp": str(datetime.datetime.now()),
-                        "fund_identifier_used": fund_identifier,
-                        "map_id_used": map_id
-                    }
-                },
-                "content_chunks": content_chunks,
-                "summary": {
-                    "total_chunks": len(content_chunks),
-                    "total_pages": len(all_elements),
-                    "total_words": sum(chunk["metadata"]["word_count"] for chunk in content_chunks),
-                    "total_images": sum(len(page["images"]) for page in all_elements),
-                    "total_tables": sum(len(page["tables"]) for page in all_elements),
-                    "content_types": list(set(
-                        ctype for chunk in content_chunks 
-                        for ctype in chunk["metadata"]["content_types"]
-                    ))
-                },
-                "page_elements": all_elements
+            # 2. Estrutura final dos dados com informações SQL
+            document_info = {
+                "filename": file_name,
+                "source_path": path_str,
+                "metadata": doc_metadata,
+                "extraction_config": {
+                    "chunk_size": self.chunk_size,
+                    "overlap": self.overlap,
+                    "extraction_timestamp": extraction_timestamp,
+                    "fund_identifier_used": fund_identifier,
+                    "map_id_used": map_id
+                }
             }
+            # 3. Extrair as páginas sob demanda, somando os totais à medida que passam
+            page_totals = {"total_pages": max(0, last_page - first_page), "total_images": 0, "total_tables": 0}
+            raw_pages = [] if include_raw else None
+            pages = self._tally_pages(self._iter_all_pages(doc, path_str, first_page, last_page),
+                                      page_totals, raw_pages)
             
-            # 5. Salvar resultado
+            # 4. Criar chunks e gravar o resultado à medida que as páginas são extraídas
             output_file = output_dir / f"{file_path.stem}_chunks.json"
-            with open(output_file, 'w', encoding='utf-8') as f:
-                json.dump(extracted_data, f, indent=2, ensure_ascii=False)
+            summary = self.save_chunks_json(
+                output_file, document_info, self.iter_content_chunks(pages, total_pages),
+                page_totals, raw_pages
+            )
+            logger.info("Criados %d chunks de conteúdo", summary["total_chunks"])
+            extracted_data = {
+                "document_info": document_info,
+                "summary": summary,
+                "output_file": str(output_file)
+            }
             
-            # 6. Mostrar resumo com dados SQL
-            print(f"\nEXTRAÇÃO CONCLUÍDA!")
-            print(f"Estatísticas:")
-            print(f" - Chunks criados: {extracted_data['summary']['total_chunks']}")
-            print(f" - Palavras totais: {extracted_data['summary']['total_words']:,}")
-            print(f" - Imagens detectadas: {extracted_data['summary']['total_images']}")
-            print(f" - Tabelas detectadas: {extracted_data['summary']['total_tables']}")
+            # 5. Mostrar resumo com dados SQL (montado e emitido de uma vez)
+            report = [
+                "",
+                "EXTRAÇÃO CONCLUÍDA!",
+                "Estatísticas:",
+                f" - Chunks criados: {summary['total_chunks']}",
+                f" - Palavras totais: {summary['total_words']:,}",
+                f" - Imagens detectadas: {summary['total_images']}",
+                f" - Tabelas detectadas: {summary['total_tables']}"
+            ]
             
             # Mostrar informações SQL se disponível
             sql_info = doc_metadata.get("fund_database_info", {})
             if sql_info.get("sql_data_available", False):
-                print(f"\nINFORMAÇÕES DO FUNDO (SQL):")
-                print(f" - MapID: {sql_info.get('map_id', 'N/A')}")
-                print(f" - Gestor: {sql_info.get('management_company', 'N/A')}")
-                print(f" - Fundo: {sql_info.get('fund_name', 'N/A')}")
-                print(f" - Nome curto: {sql_info.get('fund_short_name', 'N/A')}")
-                print(f" - Asset class: {sql_info.get('asset_class_report', 'N/A')}")
-                print(f" - Moeda: {sql_info.get('return_currency', 'N/A')}")
+                report += [
+                    "",
+                    "INFORMAÇÕES DO FUNDO (SQL):",
+                    f" - MapID: {sql_info.get('map_id', 'N/A')}",
+                    f" - Gestor: {sql_info.get('management_company', 'N/A')}",
+                    f" - Fundo: {sql_info.get('fund_name', 'N/A')}",
+                    f" - Nome curto: {sql_info.get('fund_short_name', 'N/A')}",
+                    f" - Asset class: {sql_info.get('asset_class_report', 'N/A')}",
+                    f" - Moeda: {sql_info.get('return_currency', 'N/A')}"
+                ]
             else:
-                print(f"\nInformações SQL não disponíveis")
+                report += ["", "Informações SQL não disponíveis"]
                 if sql_info.get("total_records_found", 0) > 1:
-                    print(f"Sugestão: Use MapID específico para seleção precisa")
-            
-            print(f"\nArquivo salvo: {output_file}")
+                    report.append("Sugestão: Use MapID específico para seleção precisa")
             
-            doc.close()
+            report += ["", f"Arquivo salvo: {output_file}"]
+            logger.info("\n".join(report))
             return extracted_data
             
         except Exception as e:
-            print(f"Erro na extração: {e}")
+            logger.error("Erro na extração: %s", e)
             return None
+        finally:
+            # Fechar também em caso de erro, para não reter o documento do MuPDF
+            if doc is not None:
+                doc.close()
+
+    def _iter_all_pages(self, doc, pdf_path: str, first_page: int = 0,
+                        last_page: Optional[int] = None) -> Iterator[Dict]:
+        """Extrai os elementos das páginas [first_page, last_page), em paralelo nos PDFs grandes.
+        
+        As páginas são geradas em ordem, conforme ficam prontas. Em paralelo,
+        cada processo abre o próprio PDF e trata uma faixa de páginas.
+        """
+        if last_page is None:
+            last_page = len(doc)
+        page_count = last_page - first_page
+        if page_count < self.parallel_min_pages:
+            for page_num in range(first_page, last_page):
+                yield self.extract_page_elements(doc, page_num)
+            return
+        
+        workers = os.cpu_count() or 1
+        slice_size = max(1, page_count // (workers * 2))
+        starts = range(first_page, last_page, slice_size)
+        ends = [min(start + slice_size, last_page) for start in starts]
+        logger.info("Extraindo páginas em paralelo (%d processos)", workers)
+        
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            slices = executor.map(_extract_page_slice, repeat(self), repeat(pdf_path), starts, ends)
+            for pages in slices:
+                yield from pages
+
+    @staticmethod
+    def _tally_pages(pages: Iterable[Dict], page_totals: Dict[str, int],
+                     raw_pages: Optional[List[Dict]] = None) -> Iterator[Dict]:
+        """Repassa as páginas somando imagens/tabelas em page_totals.
+        
+        Se raw_pages for uma lista, guarda nela cada página (para page_elements).
+        Os totais são acumulados em variáveis locais e gravados ao final.
+        """
+        total_images = total_tables = 0
+        for page in pages:
+            total_images += len(page["images"])
+            total_tables += len(page["tables"])
+            if raw_pages is not None:
+                raw_pages.append(page)
+            yield page
+        page_totals["total_images"] = total_images
+        page_totals["total_tables"] = total_tables
+
+    @staticmethod
+    def _json_fragment(value, level: int) -> bytes:
+        """Serializa um valor indentado (UTF-8) para ser embutido no nível indicado."""
+        if ORJSON_AVAILABLE:
+            data = orjson.dumps(value, option=orjson.OPT_INDENT_2)
+        else:
+            data = json.dumps(value, indent=2, ensure_ascii=False).encode('utf-8')
+        return data.replace(b"\n", b"\n" + b"  " * level)
+
+    def save_chunks_json(self, output_file: Path, document_info: Dict,
+                         content_chunks: Iterable[ContentChunk], page_totals: Dict,
+                         page_elements: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        """Grava o JSON de saída em partes, sem montar um dict único com tudo.
+        
+        Os chunks são gravados conforme chegam do gerador e os totais do
+        summary são acumulados na mesma passada. page_elements só é gravado
+        quando informado; cada página é liberada da lista logo após ser
+        gravada. Retorna o summary.
+        """
+        total_chunks = 0
+        total_words = 0
+        content_types = set()
+        
+        # As páginas são extraídas durante a gravação: grava num temporário ao lado
+        # e só substitui o arquivo final depois do '}', para uma falha no meio não
+        # deixar um JSON truncado (nem apagar a saída de uma execução anterior)
+        tmp_file = output_file.with_name(output_file.name + '.tmp')
+        try:
+            # Binário com buffer grande: os fragmentos já chegam em UTF-8
+            with open(tmp_file, 'wb', buffering=_OUTPUT_BUFFER_SIZE) as f:
+                f.write(b'{\n  "document_info": ')
+                f.write(self._json_fragment(document_info, 1))
+                
+                f.write(b',\n  "content_chunks": [')
+                for chunk in content_chunks:
+                    f.write(b',\n    ' if total_chunks else b'\n    ')
+                    # orjson serializa dataclasses direto; json precisa do dict
+                    f.write(self._json_fragment(chunk if ORJSON_AVAILABLE else chunk.to_dict(), 2))
+                    total_chunks += 1
+                    total_words += chunk.metadata.word_count
+                    content_types.update(chunk.metadata.content_types)
+                
+                summary = {
+                    "total_chunks": total_chunks,
+                    "total_pages": page_totals["total_pages"],
+                    "total_words": total_words,
+                    "total_images": page_totals["total_images"],
+                    "total_tables": page_totals["total_tables"],
+                    "content_types": sorted(content_types)  # Ordem estável entre execuções
+                }
+                f.write(b'\n  ],\n  "summary": ')
+                f.write(self._json_fragment(summary, 1))
+                
+                if page_elements is not None:
+                    f.write(b',\n  "page_elements": [')
+                    for i in range(len(page_elements)):
+                        page, page_elements[i] = page_elements[i], None
+                        f.write(b',\n    ' if i else b'\n    ')
+                        f.write(self._json_fragment(page, 2))
+                    f.write(b'\n  ]')
+                f.write(b'\n}\n')
+            os.replace(tmp_file, output_file)
+        except BaseException:
+            tmp_file.unlink(missing_ok=True)
+            raise
+        
+        return summary
+
+
+_FUND_CACHE: Dict[Tuple[Optional[str], Optional[int]], Dict[str, Any]] = {}
+
+
+def _lookup_fund(fund_identifier: Optional[str], map_id: Optional[int]) -> Dict[str, Any]:
+    """Consulta do fundo no SQL memorizada durante a vida do processo.
+    
+    Só guarda consultas com dados; falhas de conexão ou fundo não encontrado
+    são refeitas na próxima chamada.
+    """
+    key = (fund_identifier, map_id)
+    cached = _FUND_CACHE.get(key)
+    if cached is not None:
+        return cached
+    info = PDFToChunksExtractor.get_fund_info_from_sql(fund_identifier, map_id)
+    if info.get("sql_data_available", False) and len(_FUND_CACHE) < 512:
+        _FUND_CACHE[key] = info
+    return info
+
+
+def _extract_page_slice(extractor: PDFToChunksExtractor, pdf_path: str,
+                        start: int, end: int) -> List[Dict]:
+    """Worker do pool de processos: extrai as páginas [start, end) do PDF."""
+    doc = fitz.open(pdf_path)
+    try:
+        return [extractor.extract_page_elements(doc, page_num) for page_num in range(start, end)]
+    finally:
+        doc.close()
 
 
 def main():
     """Função principal com suporte a MapID e identificador de fundo."""
+    logging.basicConfig(level=logging.INFO, format="%(message)s")
     print("Extrator PDF para Chunks Contextuais - Com Integração SQL")
     
+    parser = argparse.ArgumentParser(
+        description="Extrai um PDF para chunks contextuais com dados do fundo (SQL).",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+        allow_abbrev=False,
+        epilog=(
+            "Exemplos:\n"
+            " python chunkslimpo.py documento.pdf\n"
+            " python chunkslimpo.py documento.pdf 'Pershing Square'\n"
+            " python chunkslimpo.py documento.pdf --map-id 123\n"
+            " python chunkslimpo.py documento.pdf --map-id 123 --chunk-size 1500\n"
+            " python chunkslimpo.py --chunk-size 1500 -- documento.pdf '-Fundo X'"
+        )
+    )
+    parser.add_argument("pdf_file", help="arquivo PDF de entrada")
+    parser.add_argument("fund_identifier", nargs="?", help="nome/identificador do fundo para busca no SQL")
+    parser.add_argument("--map-id", type=int, help="MapID do fundo (prioritário sobre o identificador)")
+    parser.add_argument("--chunk-size", type=int, default=1000, help="tamanho máximo do chunk em caracteres")
+    parser.add_argument("--overlap", type=int, default=200, help="sobreposição entre chunks em caracteres")
+    parser.add_argument("--include-raw", action="store_true",
+                        help="incluir page_elements (elementos brutos por página) no JSON")
+    parser.add_argument("--page-range", type=int, nargs=2, metavar=("INICIO", "FIM"),
+                        help="extrair só as páginas INICIO a FIM (base 1, inclusivo)")
+    parser.add_argument("--no-cache", action="store_true", help="não reutilizar consultas SQL do fundo já feitas")
+    
     if len(sys.argv) < 2:
-        print("\nCOMO USAR:")
-        print(" python pdf_extractor.py <arquivo.pdf>")
-        print(" python pdf_extractor.py <arquivo.pdf> <fund_identifier>")
-        print(" python pdf_extractor.py <arquivo.pdf> --map-id <MapID>")
-        print(" python pdf_extractor.py <arquivo.pdf> --map-id <MapID> <chunk_size>")
-        print("\nExemplos:")
-        print(" python pdf_extractor.py documento.pdf")
-        print(" python pdf_extractor.py documento.pdf 'Pershing Square'")
-        print(" python pdf_extractor.py documento.pdf --map-id 123")
-        print(" python pdf_extractor.py documento.pdf --map-id 123 1500")
+        parser.print_help()
         return
-
-    pdf_file = sys.argv[1]
-    fund_identifier = None
-    map_id = None
-    chunk_size = 1000
-    overlap = 200
     
-    # Processar argumentos
-    i = 2
-    while i < len(sys.argv):
-        if sys.argv[i] == "--map-id" and i + 1 < len(sys.argv):
-            try:
-                map_id = int(sys.argv[i + 1])
-                i += 2
-            except ValueError:
-                print(f"Erro: MapID deve ser um número inteiro: {sys.argv[i + 1]}")
-                return
-        elif sys.argv[i].isdigit() and not map_id:  # chunk_size
-            chunk_size = int(sys.argv[i])
-            i += 1
-        elif not fund_identifier and not map_id:  # fund_identifier
-            fund_identifier = sys.argv[i]
-            i += 1
-        else:
-            i += 1
+    args = parser.parse_args()
+    pdf_file = args.pdf_file
+    fund_identifier = args.fund_identifier
+    map_id = args.map_id
+    chunk_size = args.chunk_size
+    overlap = args.overlap
+    # CLI usa páginas base 1 inclusivas; o extrator usa [início, fim) base 0
+    page_range = (args.page_range[0] - 1, args.page_range[1]) if args.page_range else None
     
     if not Path(pdf_file).exists():
         print(f"Arquivo não encontrado: {pdf_file}")
@@ -879,7 +1230,9 @@ def main():
     
     # Criar extrator e executar
     extractor = PDFToChunksExtractor(chunk_size=chunk_size, overlap=overlap)
-    result = extractor.extract_to_chunks(pdf_file, fund_identifier=fund_identifier, map_id=map_id)
+    result = extractor.extract_to_chunks(pdf_file, fund_identifier=fund_identifier, map_id=map_id,
+                                         use_sql_cache=not args.no_cache,
+                                         include_raw=args.include_raw, page_range=page_range)
     
     if result:
         print(f"\nRESULTADO OTIMIZADO PARA LLM!")
@@ -888,8 +1241,9 @@ def main():
 
 
 if __name__ == "__main__":
-    print("\nEXEMPLO PARA SEU ARQUIVO:")
-    print(" python pdf_extractor.py C:\\extrair\\paginas.pdf --map-id 2972")
-    print(" python pdf_extractor.py C:\\extrair\\paginas.pdf 'Pershing Square'")
-    print()
+    if len(sys.argv) < 2:
+        print("\nEXEMPLO PARA SEU ARQUIVO:")
+        print(" python chunkslimpo.py C:\\extrair\\paginas.pdf --map-id 2972")
+        print(" python chunkslimpo.py C:\\extrair\\paginas.pdf 'Pershing Square'")
+        print()
     main()
\ No newline at end of file
@@ -4,9 +4,15 @@ Extrator de PDF para Markdown - Versão Adaptada
 Foco na extração completa de conteúdo e salvamento em markdown
 """
 
+import io
 import json
+import os
 import sys
 import re
+import shutil
+import statistics
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import datetime
 
@@ -18,13 +24,104 @@ except ImportError:
     print("❌ Execute: pip install PyMuPDF")
     sys.exit(1)
 
+# Processos para extrair páginas em paralelo (cada página é independente)
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Documento e dados da extração em cada processo do pool (ver _init_page_worker)
+_worker_doc = None
+_worker_first_images = None
+_worker_image_dir = None
+_worker_vector_graphics = True
+
+# Gravação das imagens em threads, sobrepondo o disco com a extração das páginas
+_image_writer = None
+_pending_writes = []
+
+# Dict de texto sem as imagens embutidas: elas são extraídas à parte, na etapa 3
+_TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Padrões compilados uma vez, fora do laço de linhas/blocos
+_TABLE_RE = re.compile(r'\d+\s+\d+\s+\d+')
+_BLANKLINE_RE = re.compile(r'\n\s*\n')
+
+# Cabeçalho: fonte ao menos 30% maior que a mediana da página, ou bloco curto em negrito
+_HEADING_SIZE_RATIO = 1.3
+_HEADING_BOLD_MAX_LEN = 120
+_BOLD_FLAG = 16  # bit de negrito em span["flags"]
+
+# Imagens nesses formatos, em Gray (1) ou RGB (3), são gravadas com os bytes
+# originais do PDF, sem decodificar e recodificar em PNG
+_PASSTHROUGH_EXTS = frozenset({"png", "jpeg", "jpg"})
+_PASSTHROUGH_COLORSPACES = frozenset({1, 3})
+
+# Colorspaces convertidos para RGB antes de gravar o PNG
+_NEEDS_RGB_CONVERT = frozenset({"DeviceN", "Separation", "Lab", "ICCBased"})
+
+
+def _build_blocks(blocks: list):
+    """Monta os blocos formatados do dict de texto e separa cabeçalhos e parágrafos.
+    
+    Função pura (só recebe os blocos do PyMuPDF) para poder ser compilada à
+    parte se um dia for preciso. Os spans são percorridos uma vez só: o texto,
+    a maior fonte e o negrito de cada bloco saem na mesma passada que coleta os
+    tamanhos para a mediana da página.
+    """
+    pending = []
+    span_sizes = []
+    for block in blocks:
+        if "lines" not in block:  # Só blocos de texto
+            continue
+        texts = []
+        max_size = 0
+        any_bold = False
+        for line in block["lines"]:
+            for span in line.get("spans", []):
+                text = span.get("text", "").strip()
+                if text:
+                    size = span.get("size", 0)
+                    texts.append(text)
+                    span_sizes.append(size)
+                    if size > max_size:
+                        max_size = size
+                    if span.get("flags", 0) & _BOLD_FLAG:
+                        any_bold = True
+        if texts:
+            pending.append((" ".join(texts), block.get("bbox", []), max_size, any_bold))
+    
+    # Tamanho de fonte típico da página, calculado uma vez para todos os blocos
+    heading_size = statistics.median(span_sizes) * _HEADING_SIZE_RATIO if span_sizes else 0
+    
+    formatted_blocks, headings, paragraphs = [], [], []
+    for block_text, bbox, max_size, any_bold in pending:
+        # Detectar cabeçalhos pela fonte: maior que a da página ou em negrito
+        if max_size >= heading_size or (any_bold and len(block_text) < _HEADING_BOLD_MAX_LEN):
+            block_type = "heading"
+            headings.append(block_text)
+        else:
+            block_type = "paragraph"
+            paragraphs.append(block_text)
+        formatted_blocks.append({"text": block_text, "bbox": bbox, "type": block_type})
+    
+    return formatted_blocks, headings, paragraphs
+
 
 class PDFToMarkdownExtractor:
     """Extrator completo de PDF para Markdown com análise de estrutura."""
 
     @staticmethod
-    def extract_page_content(doc, page_num: int) -> dict:
-        """Extração completa do conteúdo de uma página."""
+    def extract_page_content(doc, page_num: int, first_images: dict = None,
+                             output_dir: Path = None, vector_graphics: bool = True) -> dict:
+        """Extração completa do conteúdo de uma página.
+        
+        first_images (xref -> (página, índice), ver _first_image_occurrences) indica
+        onde cada imagem aparece pela primeira vez no documento: uma imagem repetida
+        (logo, cabeçalho) só é extraída lá; nas demais ocorrências fica um marcador
+        {"index", "repeat_of": xref}, completado por _resolve_repeated_images.
+        output_dir é o diretório de imagens já preparado (ver prepare_image_dir);
+        sem ele, o diretório é preparado nesta chamada.
+        Com vector_graphics=False, páginas sem imagens não passam por get_drawings
+        (caro) e has_vector_graphics não é preenchido.
+        """
         page = doc[page_num]
         print(f"\n🔍 Extraindo página {page_num + 1}")
         print(f"📐 Dimensões: {page.rect.width:.0f} x {page.rect.height:.0f}")
@@ -59,9 +156,17 @@ class PDFToMarkdownExtractor:
             }
         }
 
-        # 1. EXTRAÇÃO DE TEXTO BRUTO
+        # 1. EXTRAÇÃO DE TEXTO BRUTO (uma única leitura do conteúdo da página)
+        blocks = []
         try:
-            raw_text = page.get_text()
+            text_dict = page.get_text("dict", flags=_TEXT_DICT_FLAGS)
+            blocks = text_dict.get("blocks", [])
+            # Texto bruto montado das linhas do dict, como o page.get_text()
+            raw_text = "\n".join(
+                "".join(span.get("text", "") for span in line.get("spans", []))
+                for block in blocks if "lines" in block
+                for line in block["lines"]
+            )
             content["text"]["raw_text"] = raw_text.strip()
             content["text"]["word_count"] = len(raw_text.split()) if raw_text else 0
             content["text"]["has_content"] = bool(raw_text.strip())
@@ -70,39 +175,12 @@ class PDFToMarkdownExtractor:
             print(f"❌ Erro na extração de texto: {e}")
             content["text"]["raw_text"] = f"[ERRO NA EXTRAÇÃO: {e}]"
 
-        # 2. EXTRAÇÃO DE TEXTO ESTRUTURADO
+        # 2. EXTRAÇÃO DE TEXTO ESTRUTURADO (mesmos blocos da etapa 1)
         try:
-            text_dict = page.get_text("dict")
-            blocks = text_dict.get("blocks", [])
-            
-            for block in blocks:
-                if "lines" in block:  # Bloco de texto
-                    block_text = ""
-                    for line in block["lines"]:
-                        for span in line.get("spans", []):
-                            text = span.get("text", "").strip()
-                            if text:
-                                block_text += text + " "
-                    
-                    if block_text.strip():
-                        # Classificar tipo de bloco
-                        block_info = {
-                            "text": block_text.strip(),
-                            "bbox": block.get("bbox", []),
-                            "type": "paragraph"
-                        }
-                        
-                        # Detectar cabeçalhos (texto em maiúsculo, fonte maior, etc.)
-                        if block_text.isupper() or len(block_text) < 100:
-                            if any(word in block_text.upper() for word in 
-                                  ["CONFIDENTIAL", "MEMORANDUM", "FUND", "NOTICE", "REGULATORY"]):
-                                block_info["type"] = "heading"
-                                content["structure"]["headings"].append(block_text.strip())
-                        
-                        content["text"]["formatted_blocks"].append(block_info)
-                        
-                        if block_info["type"] == "paragraph":
-                            content["structure"]["paragraphs"].append(block_text.strip())
+            formatted_blocks, headings, paragraphs = _build_blocks(blocks)
+            content["text"]["formatted_blocks"] = formatted_blocks
+            content["structure"]["headings"] = headings
+            content["structure"]["paragraphs"] = paragraphs
 
         except Exception as e:
             print(f"❌ Erro na extração estruturada: {e}")
@@ -113,26 +191,10 @@ class PDFToMarkdownExtractor:
             content["images"]["count"] = len(images)
             print(f"📸 Imagens encontradas: {len(images)}")
 
-            # Criar diretório com tratamento de erro melhorado
-            output_dir = Path("C:/extrair/extracted_images")
-            try:
-                output_dir.mkdir(parents=True, exist_ok=True)
-                print(f"📁 Diretório criado/verificado: {output_dir}")
-                
-                # Testar permissões de escrita
-                test_file = output_dir / "test_write.tmp"
-                test_file.write_text("test")
-                test_file.unlink()
-                print("✅ Permissões de escrita OK")
-                
-            except Exception as dir_error:
-                print(f"❌ Erro ao criar diretório: {dir_error}")
-                # Tentar diretório alternativo
-                output_dir = Path.cwd() / "extracted_images"
-                output_dir.mkdir(exist_ok=True)
-                print(f"📁 Usando diretório alternativo: {output_dir}")
-
-            if len(images) == 0:
+            if output_dir is None:
+                output_dir = prepare_image_dir()
+
+            if len(images) == 0 and vector_graphics:
                 print("ℹ️ Nenhuma imagem encontrada nesta página")
                 # Verificar se há elementos vetoriais que podem ser convertidos
                 drawings = page.get_drawings()
@@ -142,6 +204,20 @@ class PDFToMarkdownExtractor:
 
             for i, img in enumerate(images):
                 print(f"\n📸 Processando imagem {i + 1}/{len(images)}:")
+                
+                # Imagem extraída na sua primeira ocorrência: só marcar a referência
+                first_page, first_index = (first_images or {}).get(img[0], (page_num, i))
+                if (first_page, first_index) != (page_num, i):
+                    content["images"]["details"].append({"index": i + 1, "repeat_of": img[0]})
+                    print(f" ♻️ Imagem repetida (xref {img[0]}): extraída na página {first_page + 1}")
+                    continue
+                
+                if img[0] <= 0:
+                    print(" ❌ Imagem sem xref válido - ignorando")
+                    content["images"]["details"].append({"index": i + 1, "error": "xref inválido",
+                                                         "raw_image_info": str(img)})
+                    continue
+                
                 try:
                     # Informações da imagem
                     img_info = {
@@ -157,104 +233,128 @@ class PDFToMarkdownExtractor:
                     }
                     print(f" Info: {img_info['width']}x{img_info['height']}, {img_info['colorspace']}")
                     
-                    # Tentar extrair a imagem
-                    pix = None
+                    # Imagem minúscula (espaçador etc.): decidir pelas dimensões declaradas,
+                    # antes de ler ou decodificar qualquer coisa
+                    declared_pixels = img[2] * img[3]
+                    if declared_pixels <= 100:
+                        print(f" ⚠️ Imagem muito pequena ({declared_pixels} pixels) - ignorando")
+                        img_detail = {
+                            "index": i + 1,
+                            "dimensions": f"{img[2]}x{img[3]}",
+                            "pixels": declared_pixels,
+                            "aspect_ratio": round(img[2] / img[3], 2) if img[3] > 0 else 0,
+                            "skipped": "too_small"
+                        }
+                        content["images"]["details"].append(img_detail)
+                        continue
+                    
+                    # Caminho rápido: imagem embutida já em formato final
+                    image_data = None
+                    try:
+                        image_data = doc.extract_image(img[0])
+                    except Exception as ext_error:
+                        print(f" ⚠️ extract_image falhou: {ext_error}")
+                    
+                    if (image_data and image_data["ext"] in _PASSTHROUGH_EXTS
+                            and image_data["colorspace"] in _PASSTHROUGH_COLORSPACES):
+                        width, height = image_data["width"], image_data["height"]
+                        pixels = width * height
+                        aspect = round(width / height, 2) if height > 0 else 0
+                        img_detail = {
+                            "index": i + 1,
+                            "extraction_method": "extract_image",
+                            "dimensions": f"{width}x{height}",
+                            "pixels": pixels,
+                            "aspect_ratio": aspect,
+                            "ext": image_data["ext"],
+                            "colorspace": image_data["colorspace"],
+                            "size_bytes": len(image_data["image"]),
+                            "filename": f"page_{page_num + 1}_image_{i + 1}.{image_data['ext']}"
+                        }
+                        img_file = output_dir / img_detail["filename"]
+                        
+                        if pixels > 100:  # Pelo menos 100 pixels
+                            _submit_image_write(img_file, image_data["image"])
+                            content["images"]["extracted_paths"].append(str(img_file))
+                            print(f" 💾 Imagem salva (original {image_data['ext']}): {img_file} ({pixels:,} pixels)")
+                            PDFToMarkdownExtractor._classify_chart(content, img_detail, pixels, aspect)
+                        else:
+                            print(f" ⚠️ Imagem muito pequena ({pixels} pixels) - ignorando")
+                            img_detail["skipped"] = "too_small"
+                        
+                        content["images"]["details"].append(img_detail)
+                        continue
+                    
+                    # Demais casos: decodificar via Pixmap e gravar PNG
                     try:
                         pix = fitz.Pixmap(doc, img[0])
-                        print(f" ✅ Pixmap criado: {pix.width}x{pix.height}, colorspace: {pix.colorspace.name if pix.colorspace else 'None'}")
                     except Exception as pix_error:
                         print(f" ❌ Erro ao criar Pixmap: {pix_error}")
-                        # Tentar método alternativo
-                        try:
-                            image_data = doc.extract_image(img[0])
-                            img_detail = {
-                                "index": i + 1,
-                                "extraction_method": "extract_image",
-                                "ext": image_data["ext"],
-                                "width": image_data["width"],
-                                "height": image_data["height"],
-                                "colorspace": image_data["colorspace"],
-                                "size_bytes": len(image_data["image"]),
-                                "filename": f"page_{page_num + 1}_image_{i + 1}.{image_data['ext']}"
-                            }
-                            
-                            # Salvar usando dados brutos
-                            img_file = output_dir / img_detail["filename"]
-                            with open(img_file, 'wb') as f:
-                                f.write(image_data["image"])
-                            
-                            content["images"]["extracted_paths"].append(str(img_file))
-                            content["images"]["details"].append(img_detail)
-                            print(f" 💾 Imagem salva (método alternativo): {img_file}")
-                            continue
-                            
-                        except Exception as alt_error:
-                            print(f" ❌ Método alternativo também falhou: {alt_error}")
+                        # Tentar método alternativo (reaproveita o extract_image acima)
+                        img_file = output_dir / f"page_{page_num + 1}_image_{i + 1}"
+                        img_detail = PDFToMarkdownExtractor._extract_raw(doc, img[0], image_data, img_file, i + 1)
+                        if img_detail is None:
                             content["images"]["details"].append({
                                 "index": i + 1, 
-                                "error": f"Pixmap: {pix_error}, Alternative: {alt_error}",
+                                "error": f"Pixmap: {pix_error}, Alternative: extract_image falhou",
                                 "raw_info": img_info
                             })
                             continue
+                        
+                        content["images"]["extracted_paths"].append(str(output_dir / img_detail["filename"]))
+                        content["images"]["details"].append(img_detail)
+                        continue
                     
-                    if pix:
-                        try:
-                            # Tratar colorspace problemático
-                            original_colorspace = pix.colorspace.name if pix.colorspace else "None"
-                            if pix.colorspace and pix.colorspace.name in ["DeviceN", "Separation", "Lab", "ICCBased"]:
-                                print(f" 🔄 Convertendo colorspace: {original_colorspace} -> RGB")
-                                pix_rgb = fitz.Pixmap(fitz.csRGB, pix)
-                                pix.clear()  # Liberar memória
-                                pix = pix_rgb
-
-                            pixels = pix.width * pix.height
-                            aspect = round(pix.width / pix.height, 2) if pix.height > 0 else 0
-                            
-                            img_detail = {
-                                "index": i + 1,
-                                "extraction_method": "pixmap",
-                                "dimensions": f"{pix.width}x{pix.height}",
-                                "pixels": pixels,
-                                "aspect_ratio": aspect,
-                                "original_colorspace": original_colorspace,
-                                "final_colorspace": pix.colorspace.name if pix.colorspace else "None",
-                                "size_mb": round(len(pix.tobytes()) / 1024 / 1024, 3),
-                                "filename": f"page_{page_num + 1}_image_{i + 1}.png"
-                            }
-                            
-                            # Salvar imagem
-                            img_file = output_dir / img_detail["filename"]
-                            
-                            # Verificar se a imagem não está vazia
-                            if pixels > 100:  # Pelo menos 100 pixels
-                                pix.save(str(img_file))
-                                content["images"]["extracted_paths"].append(str(img_file))
-                                print(f" 💾 Imagem salva: {img_file} ({pixels:,} pixels)")
-                                
-                                # Classificar se pode ser gráfico
-                                if pixels > 50000 and 0.5 <= aspect <= 3.0:
-                                    img_detail["likely_chart"] = True
-                                    content["metadata"]["has_charts"] = True
-                                    print(f" 📊 Possível gráfico detectado!")
-                                else:
-                                    img_detail["likely_chart"] = False
-                            else:
-                                print(f" ⚠️ Imagem muito pequena ({pixels} pixels) - ignorando")
-                                img_detail["skipped"] = "too_small"
-                            
-                            content["images"]["details"].append(img_detail)
-                            
-                        except Exception as save_error:
-                            print(f" ❌ Erro ao salvar imagem: {save_error}")
-                            content["images"]["details"].append({
-                                "index": i + 1, 
-                                "error": f"Save error: {save_error}",
-                                "pixmap_info": f"{pix.width}x{pix.height}" if pix else "No pixmap"
-                            })
-                        finally:
-                            if pix:
-                                pix.clear()  # Liberar memória
-                                pix = None
+                    original_colorspace = pix.colorspace.name if pix.colorspace else "None"
+                    print(f" ✅ Pixmap criado: {pix.width}x{pix.height}, colorspace: {original_colorspace}")
+                    try:
+                        # Tratar colorspace problemático
+                        if original_colorspace in _NEEDS_RGB_CONVERT:
+                            print(f" 🔄 Convertendo colorspace: {original_colorspace} -> RGB")
+                            pix = fitz.Pixmap(fitz.csRGB, pix)  # O original é liberado com a referência
+
+                        pixels = pix.width * pix.height
+                        aspect = round(pix.width / pix.height, 2) if pix.height > 0 else 0
+                        
+                        img_detail = {
+                            "index": i + 1,
+                            "extraction_method": "pixmap",
+                            "dimensions": f"{pix.width}x{pix.height}",
+                            "pixels": pixels,
+                            "aspect_ratio": aspect,
+                            "original_colorspace": original_colorspace,
+                            "final_colorspace": pix.colorspace.name if pix.colorspace else "None",
+                            "filename": f"page_{page_num + 1}_image_{i + 1}.png"
+                        }
+                        
+                        # Salvar imagem
+                        img_file = output_dir / img_detail["filename"]
+                        
+                        # Verificar se a imagem não está vazia
+                        if pixels > 100:  # Pelo menos 100 pixels
+                            # PNG codificado uma vez só, aqui (o Pixmap é liberado logo);
+                            # o tamanho sai dos mesmos bytes e a escrita vai para a thread
+                            png_data = pix.tobytes("png")
+                            img_detail["size_mb"] = round(len(png_data) / 1024 / 1024, 3)
+                            _submit_image_write(img_file, png_data)
+                            content["images"]["extracted_paths"].append(str(img_file))
+                            print(f" 💾 Imagem salva: {img_file} ({pixels:,} pixels)")
+                            PDFToMarkdownExtractor._classify_chart(content, img_detail, pixels, aspect)
+                        else:
+                            print(f" ⚠️ Imagem muito pequena ({pixels} pixels) - ignorando")
+                            img_detail["skipped"] = "too_small"
+                        
+                        content["images"]["details"].append(img_detail)
+                        
+                    except Exception as save_error:
+                        print(f" ❌ Erro ao salvar imagem: {save_error}")
+                        content["images"]["details"].append({
+                            "index": i + 1, 
+                            "error": f"Save error: {save_error}",
+                            "pixmap_info": f"{pix.width}x{pix.height}"
+                        })
+                    finally:
+                        pix = None  # Liberar memória do Pixmap
                     
                 except Exception as img_error:
                     print(f" ❌ Erro geral ao processar imagem {i + 1}: {img_error}")
@@ -275,12 +375,17 @@ class PDFToMarkdownExtractor:
 
         # 4. DETECTAR TABELAS (baseado em padrões de texto)
         try:
-            text_lines = content["text"]["raw_text"].split('\n')
+            raw_text = content["text"]["raw_text"]
             potential_tables = []
             
+            # Pré-filtro na página inteira (uma busca em C): sem tab nem sequência
+            # de números não há linha candidata e o laço por linha é dispensado
+            has_candidates = '\t' in raw_text or _TABLE_RE.search(raw_text)
+            text_lines = raw_text.split('\n') if has_candidates else []
+            
             for i, line in enumerate(text_lines):
                 # Detectar linhas com múltiplos números separados por espaços/tabs
-                if re.search(r'\d+\s+\d+\s+\d+', line) or '\t' in line:
+                if '\t' in line or _TABLE_RE.search(line):
                     potential_tables.append({
                         "line_number": i + 1,
                         "content": line.strip()
@@ -308,131 +413,310 @@ class PDFToMarkdownExtractor:
         return content
 
     @staticmethod
-    def generate_markdown(extracted_data: dict, doc_name: str) -> str:
-        """Gerar markdown estruturado a partir dos dados extraídos."""
+    def _extract_raw(doc, xref: int, image_data, img_file: Path, index: int):
+        """Grava a imagem com os bytes de extract_image; devolve o detalhe ou None se falhar.
+        
+        img_file vem sem extensão: usa a do formato original. image_data pode
+        trazer o resultado de extract_image já obtido para o mesmo xref.
+        """
+        try:
+            if image_data is None:
+                image_data = doc.extract_image(xref)
+        except Exception as alt_error:
+            print(f" ❌ Método alternativo também falhou: {alt_error}")
+            return None
+        
+        img_detail = {
+            "index": index,
+            "extraction_method": "extract_image",
+            "ext": image_data["ext"],
+            "width": image_data["width"],
+            "height": image_data["height"],
+            "colorspace": image_data["colorspace"],
+            "size_bytes": len(image_data["image"]),
+            "filename": f"{img_file.name}.{image_data['ext']}"
+        }
         
-        md_content = []
+        # Salvar usando dados brutos
+        _submit_image_write(img_file.with_name(img_detail["filename"]), image_data["image"])
+        print(f" 💾 Imagem salva (método alternativo): {img_file.with_name(img_detail['filename'])}")
+        return img_detail
+
+    @staticmethod
+    def _classify_chart(content: dict, img_detail: dict, pixels: int, aspect: float):
+        """Marca a imagem (e a página) como possível gráfico pelo tamanho e proporção."""
+        if pixels > 50000 and 0.5 <= aspect <= 3.0:
+            img_detail["likely_chart"] = True
+            content["metadata"]["has_charts"] = True
+            print(f" 📊 Possível gráfico detectado!")
+        else:
+            img_detail["likely_chart"] = False
+
+    @staticmethod
+    def generate_markdown_header(out, doc_name: str, stats: dict):
+        """Grava em out o cabeçalho e o resumo executivo do markdown.
         
+        stats traz total_pages, total_words, total_images, chart_pages e table_pages.
+        """
         # Cabeçalho do documento
-        md_content.append(f"# {doc_name}")
-        md_content.append(f"**Extraído em:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        md_content.append(f"**Total de páginas:** {len(extracted_data['pages'])}")
-        md_content.append("")
+        out.write(f"# {doc_name}\n")
+        out.write(f"**Extraído em:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        out.write(f"**Total de páginas:** {stats['total_pages']}\n\n")
         
         # Resumo executivo
-        md_content.append("## Resumo Executivo")
-        md_content.append("")
+        out.write("## Resumo Executivo\n\n")
+        out.write(f"- **Palavras totais:** {stats['total_words']:,}\n")
+        out.write(f"- **Imagens totais:** {stats['total_images']}\n")
+        out.write(f"- **Páginas com gráficos:** {stats['chart_pages']}\n")
+        out.write(f"- **Páginas com tabelas:** {stats['table_pages']}\n\n")
         
-        total_words = sum(page["text"]["word_count"] for page in extracted_data["pages"].values())
-        total_images = sum(page["images"]["count"] for page in extracted_data["pages"].values())
-        chart_pages = [p for p in extracted_data["pages"].values() if p["metadata"]["has_charts"]]
-        table_pages = [p for p in extracted_data["pages"].values() if p["metadata"]["has_tables"]]
+        # Conteúdo página por página
+        out.write("## Conteúdo por Página\n\n")
+
+    @staticmethod
+    def generate_markdown_page(out, page_data: dict):
+        """Grava em out a seção markdown de uma página."""
+        out.write(f"### Página {page_data['page_number']}\n\n")
         
-        md_content.append(f"- **Palavras totais:** {total_words:,}")
-        md_content.append(f"- **Imagens totais:** {total_images}")
-        md_content.append(f"- **Páginas com gráficos:** {len(chart_pages)}")
-        md_content.append(f"- **Páginas com tabelas:** {len(table_pages)}")
-        md_content.append("")
+        # Metadados da página
+        out.write(f"**Tipo:** {page_data['metadata']['content_type']}\n")
+        out.write(f"**Palavras:** {page_data['text']['word_count']}\n")
+        out.write(f"**Imagens:** {page_data['images']['count']}\n\n")
         
-        # Conteúdo página por página
-        md_content.append("## Conteúdo por Página")
-        md_content.append("")
+        # Cabeçalhos detectados
+        if page_data["structure"]["headings"]:
+            out.write("#### Cabeçalhos Detectados\n")
+            for heading in page_data["structure"]["headings"]:
+                out.write(f"- {heading}\n")
+            out.write("\n")
         
-        for page_key in sorted(extracted_data["pages"].keys(), key=lambda x: int(x.split('_')[1])):
-            page_data = extracted_data["pages"][page_key]
-            page_num = page_data["page_number"]
-            
-            md_content.append(f"### Página {page_num}")
-            md_content.append("")
-            
-            # Metadados da página
-            md_content.append(f"**Tipo:** {page_data['metadata']['content_type']}")
-            md_content.append(f"**Palavras:** {page_data['text']['word_count']}")
-            md_content.append(f"**Imagens:** {page_data['images']['count']}")
-            md_content.append("")
-            
-            # Cabeçalhos detectados
-            if page_data["structure"]["headings"]:
-                md_content.append("#### Cabeçalhos Detectados")
-                for heading in page_data["structure"]["headings"]:
-                    md_content.append(f"- {heading}")
-                md_content.append("")
-            
-            # Imagens
-            if page_data["images"]["count"] > 0:
-                md_content.append("#### Imagens")
-                for img in page_data["images"]["details"]:
-                    if "error" not in img:
-                        chart_indicator = " 📊 (Possível gráfico)" if img.get("likely_chart", False) else ""
-                        md_content.append(f"- **Imagem {img['index']}:** {img['dimensions']} ({img['pixels']:,} pixels){chart_indicator}")
-                        if "filename" in img:
-                            md_content.append(f"  - Arquivo: `{img['filename']}`")
-                md_content.append("")
-            
-            # Tabelas detectadas
-            if page_data["structure"]["tables"]:
-                md_content.append("#### Tabelas Detectadas")
-                for table in page_data["structure"]["tables"][:5]:  # Mostrar apenas 5 primeiras
-                    md_content.append(f"```")
-                    md_content.append(table["content"])
-                    md_content.append(f"```")
-                if len(page_data["structure"]["tables"]) > 5:
-                    md_content.append(f"*(... e mais {len(page_data['structure']['tables']) - 5} linhas)*")
-                md_content.append("")
+        # Imagens
+        if page_data["images"]["count"] > 0:
+            out.write("#### Imagens\n")
+            for img in page_data["images"]["details"]:
+                if "error" not in img:
+                    chart_indicator = " 📊 (Possível gráfico)" if img.get("likely_chart", False) else ""
+                    out.write(f"- **Imagem {img['index']}:** {img['dimensions']} ({img['pixels']:,} pixels){chart_indicator}\n")
+                    if "filename" in img:
+                        out.write(f"  - Arquivo: `{img['filename']}`\n")
+            out.write("\n")
+        
+        # Tabelas detectadas
+        if page_data["structure"]["tables"]:
+            out.write("#### Tabelas Detectadas\n")
+            for table in page_data["structure"]["tables"][:5]:  # Mostrar apenas 5 primeiras
+                out.write(f"```\n{table['content']}\n```\n")
+            if len(page_data["structure"]["tables"]) > 5:
+                out.write(f"*(... e mais {len(page_data['structure']['tables']) - 5} linhas)*\n")
+            out.write("\n")
+        
+        # Texto da página (limitado para não ficar muito longo)
+        if page_data["text"]["has_content"]:
+            out.write("#### Conteúdo Textual\n")
+            text_content = page_data["text"]["raw_text"]
             
-            # Texto da página (limitado para não ficar muito longo)
-            if page_data["text"]["has_content"]:
-                md_content.append("#### Conteúdo Textual")
-                text_content = page_data["text"]["raw_text"]
-                
-                # Limitar tamanho do texto exibido
-                if len(text_content) > 3000:
-                    text_content = text_content[:3000] + "\n\n*(... conteúdo truncado)*"
-                
-                # Preservar quebras de linha importantes
-                text_content = re.sub(r'\n\s*\n', '\n\n', text_content)
-                md_content.append("```")
-                md_content.append(text_content)
-                md_content.append("```")
-                md_content.append("")
+            # Limitar tamanho do texto exibido
+            if len(text_content) > 3000:
+                text_content = text_content[:3000] + "\n\n*(... conteúdo truncado)*"
             
-            md_content.append("---")
-            md_content.append("")
+            # Preservar quebras de linha importantes (já sobre o texto truncado)
+            text_content = _BLANKLINE_RE.sub('\n\n', text_content)
+            out.write(f"```\n{text_content}\n```\n\n")
         
-        # Apêndices
-        md_content.append("## Apêndices")
-        md_content.append("")
+        out.write("---\n\n")
+
+    @staticmethod
+    def generate_markdown_appendix(out, image_paths: list):
+        """Grava em out os apêndices do markdown (lista de imagens extraídas)."""
+        out.write("## Apêndices\n")
         
-        # Lista de todas as imagens extraídas
-        all_images = []
-        for page_data in extracted_data["pages"].values():
-            all_images.extend(page_data["images"]["extracted_paths"])
+        if image_paths:
+            out.write("\n### Imagens Extraídas\n")
+            for img_path in image_paths:
+                out.write(f"- `{img_path}`\n")
+
+    @staticmethod
+    def page_summary(page_data: dict) -> dict:
+        """Resumo leve de uma página: o que o resumo executivo e os apêndices usam."""
+        return {
+            "page_number": page_data["page_number"],
+            "content_type": page_data["metadata"]["content_type"],
+            "word_count": page_data["text"]["word_count"],
+            "image_count": page_data["images"]["count"],
+            "headings": page_data["structure"]["headings"],
+            "has_charts": page_data["metadata"]["has_charts"],
+            "has_tables": page_data["metadata"]["has_tables"],
+            "extracted_paths": page_data["images"]["extracted_paths"]
+        }
+
+    @staticmethod
+    def summary_stats(page_summaries: list) -> dict:
+        """Totais do resumo executivo a partir dos resumos de página."""
+        return {
+            "total_pages": len(page_summaries),
+            "total_words": sum(page["word_count"] for page in page_summaries),
+            "total_images": sum(page["image_count"] for page in page_summaries),
+            "chart_pages": sum(1 for page in page_summaries if page["has_charts"]),
+            "table_pages": sum(1 for page in page_summaries if page["has_tables"])
+        }
+
+    @staticmethod
+    def generate_markdown(extracted_data: dict, doc_name: str, out=None):
+        """Gerar markdown estruturado a partir dos dados extraídos (com todas as páginas em memória).
+        
+        Grava direto em out (arquivo aberto em modo texto); sem out, devolve o markdown como str.
+        """
+        if out is None:
+            buffer = io.StringIO()
+            PDFToMarkdownExtractor.generate_markdown(extracted_data, doc_name, buffer)
+            return buffer.getvalue()
+        
+        # Ordena pelo número da própria página: serve tanto para chaves inteiras
+        # quanto para as "page_N" de um JSON carregado, sem reinterpretar as chaves
+        pages = sorted(extracted_data["pages"].values(), key=lambda page: page["page_number"])
+        page_summaries = [PDFToMarkdownExtractor.page_summary(page) for page in pages]
+        
+        PDFToMarkdownExtractor.generate_markdown_header(
+            out, doc_name, PDFToMarkdownExtractor.summary_stats(page_summaries))
+        for page in pages:
+            PDFToMarkdownExtractor.generate_markdown_page(out, page)
+        PDFToMarkdownExtractor.generate_markdown_appendix(
+            out, [path for page in page_summaries for path in page["extracted_paths"]])
+
+def _submit_image_write(img_file: Path, data: bytes):
+    """Agenda a gravação de uma imagem; wait_image_writes espera as pendentes."""
+    global _image_writer
+    if _image_writer is None:
+        _image_writer = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    _pending_writes.append(_image_writer.submit(img_file.write_bytes, data))
+
+
+def wait_image_writes():
+    """Espera as gravações de imagem pendentes e informa as que falharam."""
+    for future in _pending_writes:
+        try:
+            future.result()
+        except Exception as write_error:
+            print(f" ❌ Erro ao salvar imagem: {write_error}")
+    _pending_writes.clear()
+
+
+def prepare_image_dir() -> Path:
+    """Cria o diretório de imagens e testa a escrita uma única vez por extração."""
+    # Criar diretório com tratamento de erro melhorado
+    output_dir = Path("C:/extrair/extracted_images")
+    try:
+        output_dir.mkdir(parents=True, exist_ok=True)
+        print(f"📁 Diretório criado/verificado: {output_dir}")
         
-        if all_images:
-            md_content.append("### Imagens Extraídas")
-            for img_path in all_images:
-                md_content.append(f"- `{img_path}`")
-            md_content.append("")
+        # Testar permissões de escrita
+        test_file = output_dir / "test_write.tmp"
+        test_file.write_text("test")
+        test_file.unlink()
+        print("✅ Permissões de escrita OK")
         
-        return '\n'.join(md_content)
+    except Exception as dir_error:
+        print(f"❌ Erro ao criar diretório: {dir_error}")
+        # Tentar diretório alternativo
+        output_dir = Path.cwd() / "extracted_images"
+        output_dir.mkdir(exist_ok=True)
+        print(f"📁 Usando diretório alternativo: {output_dir}")
+    
+    return output_dir
+
+
+def _first_image_occurrences(doc) -> dict:
+    """xref -> (página, índice) da primeira ocorrência de cada imagem do documento.
+    
+    Calculado no processo principal antes da extração (get_page_images só lê a
+    lista de imagens de cada página): a ocorrência que extrai e grava cada imagem
+    não depende de qual processo do pool pegou qual página.
+    """
+    first_images = {}
+    for page_num in range(len(doc)):
+        for i, img in enumerate(doc.get_page_images(page_num, full=True)):
+            if img[0] > 0:  # Sem xref válido não há o que reaproveitar
+                first_images.setdefault(img[0], (page_num, i))
+    return first_images
+
+
+def _resolve_repeated_images(content: dict, page_firsts: list, first_details: dict,
+                             image_dir: Path):
+    """Completa os marcadores de imagem repetida com o detalhe da primeira ocorrência.
+    
+    page_firsts traz (índice, xref) das primeiras ocorrências desta página, cujos
+    detalhes entram em first_details. As páginas chegam em ordem, então a primeira
+    ocorrência de cada marcador já foi vista.
+    """
+    details = content["images"]["details"]
+    by_index = {detail["index"]: detail for detail in details}
+    for i, xref in page_firsts:
+        if i + 1 in by_index:
+            first_details[xref] = by_index[i + 1]
+    
+    resolved = False
+    for pos, detail in enumerate(details):
+        if "repeat_of" in detail:
+            details[pos] = dict(first_details[detail["repeat_of"]], index=detail["index"])
+            resolved = True
+            if details[pos].get("likely_chart"):
+                # Gráfico tem prioridade sobre os demais tipos de conteúdo
+                content["metadata"]["has_charts"] = True
+                content["metadata"]["content_type"] = "chart"
+    
+    if resolved:
+        # Caminhos na ordem das imagens, incluindo os arquivos reaproveitados
+        content["images"]["extracted_paths"] = [
+            str(image_dir / detail["filename"]) for detail in details
+            if "filename" in detail and "skipped" not in detail and "error" not in detail
+        ]
 
 
-def diagnose_pdf_images(file_path: str):
-    """Diagnóstico específico para verificar imagens no PDF."""
+def _init_page_worker(file_path: str, first_images: dict, image_dir: Path, vector_graphics: bool):
+    """Abre o PDF uma vez por processo do pool; o documento não pode ser enviado entre processos."""
+    global _worker_doc, _worker_first_images, _worker_image_dir, _worker_vector_graphics
+    _worker_doc = fitz.open(file_path)
+    _worker_first_images = first_images
+    _worker_image_dir = image_dir
+    _worker_vector_graphics = vector_graphics
+
+
+def _extract_page_worker(page_num: int) -> dict:
+    """Extrai uma página usando o documento aberto neste processo."""
+    content = PDFToMarkdownExtractor.extract_page_content(_worker_doc, page_num, _worker_first_images,
+                                                          _worker_image_dir, _worker_vector_graphics)
+    # O processo pode ser encerrado sem esperar threads: gravar antes de devolver
+    wait_image_writes()
+    return content
+
+
+def diagnose_pdf_images(file_path: str, doc=None, verbose: bool = False):
+    """Diagnóstico específico para verificar imagens no PDF.
+    
+    Aceita o documento já aberto (doc), que então não é fechado aqui. As
+    dimensões vêm de get_images, sem decodificar as imagens. Os elementos
+    vetoriais (get_drawings, caro) só são analisados com verbose, e apenas
+    nas páginas sem imagens bitmap.
+    """
     print(f"🔬 DIAGNÓSTICO DE IMAGENS - {Path(file_path).name}")
     
+    owns_doc = doc is None
     try:
-        doc = fitz.open(file_path)
+        if owns_doc:
+            doc = fitz.open(file_path)
         total_images = 0
         
         for page_num in range(len(doc)):
             page = doc[page_num]
             images = page.get_images(full=True)
-            drawings = page.get_drawings()
             
             print(f"\n📄 Página {page_num + 1}:")
             print(f" - Imagens encontradas: {len(images)}")
-            print(f" - Elementos vetoriais: {len(drawings)}")
+            
+            drawings = []
+            if verbose and len(images) == 0:
+                drawings = page.get_drawings()
+                print(f" - Elementos vetoriais: {len(drawings)}")
             
             if images:
                 total_images += len(images)
@@ -444,21 +728,6 @@ def diagnose_pdf_images(file_path: str):
                         print(f"   - Colorspace: {img[5]}")
                         print(f"   - Filter: {img[8] if len(img) > 8 else 'None'}")
                         
-                        # Tentar criar pixmap para teste
-                        try:
-                            pix = fitz.Pixmap(doc, img[0])
-                            print(f"   ✅ Pixmap OK: {pix.width}x{pix.height}")
-                            pix.clear()
-                        except Exception as pix_error:
-                            print(f"   ❌ Erro Pixmap: {pix_error}")
-                            
-                            # Tentar método extract_image
-                            try:
-                                img_data = doc.extract_image(img[0])
-                                print(f"   ✅ Extract OK: {img_data['width']}x{img_data['height']}, {img_data['ext']}")
-                            except Exception as ext_error:
-                                print(f"   ❌ Erro Extract: {ext_error}")
-                        
                     except Exception as img_error:
                         print(f"   ❌ Erro geral imagem {i+1}: {img_error}")
             
@@ -478,14 +747,69 @@ def diagnose_pdf_images(file_path: str):
             print(f" 💡 O PDF pode conter apenas gráficos vetoriais")
             print(f" 💡 Ou as imagens podem estar embutidas de forma não padrão")
         
-        doc.close()
-        
     except Exception as e:
         print(f"❌ Erro no diagnóstico: {e}")
+    finally:
+        if owns_doc and doc is not None:
+            doc.close()
 
 
-def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
-    """Extração completa de PDF para markdown."""
+def _iter_pages(doc, file_path: str, workers: int, image_dir: Path,
+                vector_graphics: bool = True):
+    """Gera o conteúdo das páginas em ordem, em paralelo quando workers > 1.
+    
+    Imagens repetidas são extraídas só na primeira ocorrência e completadas aqui,
+    no processo principal: o resultado é o mesmo com qualquer número de workers.
+    """
+    first_images = _first_image_occurrences(doc)
+    firsts_by_page = {}
+    for xref, (page_num, i) in first_images.items():
+        firsts_by_page.setdefault(page_num, []).append((i, xref))
+    first_details = {}
+    
+    if workers > 1 and len(doc) > 1:
+        print(f"⚙️ Extraindo páginas em paralelo ({workers} processos)")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                 initargs=(file_path, first_images, image_dir,
+                                           vector_graphics)) as executor:
+            # map devolve na ordem das páginas, conforme ficam prontas
+            for page_num, content in enumerate(executor.map(_extract_page_worker, range(len(doc)))):
+                _resolve_repeated_images(content, firsts_by_page.get(page_num, []), first_details,
+                                         image_dir)
+                yield content
+    else:
+        for page_num in range(len(doc)):
+            content = PDFToMarkdownExtractor.extract_page_content(doc, page_num, first_images, image_dir,
+                                                                 vector_graphics)
+            _resolve_repeated_images(content, firsts_by_page.get(page_num, []), first_details,
+                                     image_dir)
+            yield content
+
+
+def _json_fragment(value, level: int, compact: bool = False) -> str:
+    """Serializa um valor (numa única passada) para ser embutido no nível indicado do JSON.
+    
+    default=str converte o que não for serializável (o antigo json.loads(json.dumps())
+    fazia isso com duas passadas extras). compact dispensa indentação e espaços.
+    """
+    if compact:
+        return json.dumps(value, ensure_ascii=False, default=str, separators=(",", ":"))
+    data = json.dumps(value, indent=2, ensure_ascii=False, default=str)
+    return data.replace("\n", "\n" + "  " * level)
+
+
+def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair",
+                            workers: int = DEFAULT_WORKERS, compact_json: bool = False,
+                            diagnose: bool = False, vector_graphics: bool = True):
+    """Extração completa de PDF para markdown.
+    
+    Com diagnose, roda antes o diagnóstico de imagens no mesmo documento aberto.
+    Com vector_graphics=False, pula a busca de gráficos vetoriais (get_drawings).
+    Com workers > 1 as páginas são extraídas em paralelo, em processos separados.
+    Com compact_json, o JSON sai sem indentação (menor e mais rápido de gravar).
+    Cada página é gravada nos arquivos de saída assim que fica pronta; em memória
+    fica só um resumo leve por página, que é o que vai em "pages" no retorno.
+    """
     
     file_path = Path(file_path)
     output_dir = Path(output_dir)
@@ -495,11 +819,18 @@ def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
     print(f"📄 Arquivo: {file_path.name}")
     print(f"📁 Saída: {output_dir}")
     
+    doc = None
+    tmp_files = []
     try:
         doc = fitz.open(str(file_path))
         print(f"📊 Total de páginas: {len(doc)}")
         
-        # Dados extraídos
+        if diagnose:
+            print(f"\n🔍 Primeiro, vamos fazer um diagnóstico rápido...")
+            diagnose_pdf_images(str(file_path), doc)
+            print(f"\n🚀 Iniciando extração completa...")
+        
+        # Dados extraídos (as páginas completas vão direto para os arquivos)
         extracted_data = {
             "document": file_path.name,
             "source_path": str(file_path),
@@ -508,47 +839,76 @@ def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
             "pages": {}
         }
         
-        # Extrair cada página
-        for page_num in range(len(doc)):
-            page_content = PDFToMarkdownExtractor.extract_page_content(doc, page_num)
-            page_key = f"page_{page_num + 1}"
-            extracted_data["pages"][page_key] = page_content
-        
-        # Gerar markdown
-        print(f"\n📝 Gerando markdown...")
-        markdown_content = PDFToMarkdownExtractor.generate_markdown(extracted_data, file_path.stem)
-        
-        # Salvar arquivos
-        # 1. Markdown principal
         md_file = output_dir / f"{file_path.stem}_extracted.md"
-        with open(md_file, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
-        print(f"💾 Markdown salvo: {md_file}")
-        
-        # 2. JSON com dados estruturados
         json_file = output_dir / f"{file_path.stem}_data.json"
-        clean_data = json.loads(json.dumps(extracted_data, default=str))
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(clean_data, f, indent=2, ensure_ascii=False)
-        print(f"💾 Dados JSON salvos: {json_file}")
-        
-        # 3. Arquivo de texto bruto (todas as páginas)
         txt_file = output_dir / f"{file_path.stem}_raw_text.txt"
-        with open(txt_file, 'w', encoding='utf-8') as f:
-            f.write(f"EXTRAÇÃO DE TEXTO BRUTO - {file_path.name}\n")
-            f.write(f"Data: {datetime.datetime.now()}\n")
-            f.write("="*80 + "\n\n")
+        # As páginas são gravadas conforme são extraídas: tudo vai para temporários
+        # ao lado e só substitui os arquivos finais no fim, para uma falha no meio
+        # não deixar saída truncada (nem apagar a de uma execução anterior)
+        md_tmp, json_tmp, txt_tmp = tmp_files = [
+            path.with_name(path.name + ".tmp") for path in (md_file, json_file, txt_file)]
+        page_summaries = []
+        image_dir = prepare_image_dir()
+        
+        # O corpo do markdown vai para um temporário: o resumo executivo, que
+        # abre o arquivo, só é conhecido depois da última página
+        with tempfile.TemporaryFile('w+', encoding='utf-8', dir=output_dir) as md_body, \
+                open(json_tmp, 'w', encoding='utf-8') as json_out, \
+                open(txt_tmp, 'w', encoding='utf-8') as txt_out:
+            
+            txt_out.writelines((f"EXTRAÇÃO DE TEXTO BRUTO - {file_path.name}\n",
+                                f"Data: {datetime.datetime.now()}\n",
+                                "="*80 + "\n\n"))
             
-            for page_key in sorted(extracted_data["pages"].keys(), key=lambda x: int(x.split('_')[1])):
-                page_data = extracted_data["pages"][page_key]
-                f.write(f"\n--- PÁGINA {page_data['page_number']} ---\n\n")
-                f.write(page_data["text"]["raw_text"])
-                f.write("\n\n")
+            json_out.write("{\n")
+            for key, value in extracted_data.items():
+                if key != "pages":
+                    json_out.write(f"  {json.dumps(key)}: {_json_fragment(value, 1, compact_json)},\n")
+            json_out.write('  "pages": {')
+            
+            # Extrair cada página e gravar já nos três arquivos
+            # (o retorno usa o número da página como chave; "page_N" só no JSON)
+            for page_content in _iter_pages(doc, str(file_path), workers, image_dir,
+                                            vector_graphics):
+                page_number = page_content["page_number"]
+                page_key = f"page_{page_number}"
+                
+                txt_out.writelines((f"\n--- PÁGINA {page_content['page_number']} ---\n\n",
+                                    page_content["text"]["raw_text"], "\n\n"))
+                
+                json_out.write(",\n    " if page_summaries else "\n    ")
+                json_out.write(f"{json.dumps(page_key)}: {_json_fragment(page_content, 2, compact_json)}")
+                
+                PDFToMarkdownExtractor.generate_markdown_page(md_body, page_content)
+                
+                summary = PDFToMarkdownExtractor.page_summary(page_content)
+                page_summaries.append(summary)
+                extracted_data["pages"][page_number] = summary
+            
+            json_out.write("\n  }\n}" if page_summaries else "}\n}")
+            wait_image_writes()
+            
+            # Gerar markdown: cabeçalho + corpo já gravado + apêndices
+            print(f"\n📝 Gerando markdown...")
+            stats = PDFToMarkdownExtractor.summary_stats(page_summaries)
+            md_body.seek(0)
+            with open(md_tmp, 'w', encoding='utf-8') as f:
+                PDFToMarkdownExtractor.generate_markdown_header(f, file_path.stem, stats)
+                shutil.copyfileobj(md_body, f)
+                PDFToMarkdownExtractor.generate_markdown_appendix(
+                    f, [path for page in page_summaries for path in page["extracted_paths"]])
+        
+        for tmp, final in zip(tmp_files, (md_file, json_file, txt_file)):
+            os.replace(tmp, final)
+        tmp_files = []
+        
+        print(f"💾 Markdown salvo: {md_file}")
+        print(f"💾 Dados JSON salvos: {json_file}")
         print(f"💾 Texto bruto salvo: {txt_file}")
         
         # Resumo final
-        total_words = sum(page["text"]["word_count"] for page in extracted_data["pages"].values())
-        total_images = sum(page["images"]["count"] for page in extracted_data["pages"].values())
+        total_words = stats["total_words"]
+        total_images = stats["total_images"]
         
         print(f"\n✅ EXTRAÇÃO CONCLUÍDA!")
         print(f"📊 Estatísticas:")
@@ -557,51 +917,86 @@ def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
         print(f" - Arquivos gerados: 3 (markdown, JSON, texto bruto)")
         print(f" - Diretório de saída: {output_dir}")
         
-        doc.close()
         return extracted_data
         
     except Exception as e:
         print(f"❌ Erro na extração: {e}")
         return None
+    finally:
+        for tmp in tmp_files:
+            tmp.unlink(missing_ok=True)
+        if doc is not None:
+            doc.close()
 
 
 def main():
     """Função principal."""
     print("🚀 Extrator PDF para Markdown")
     
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    
+    # Opção --workers N (processos para extrair páginas em paralelo)
+    workers = DEFAULT_WORKERS
+    if "--workers" in args:
+        idx = args.index("--workers")
+        try:
+            workers = int(args[idx + 1])
+        except (IndexError, ValueError):
+            print("❌ --workers requer um número inteiro")
+            return
+        del args[idx:idx + 2]
+    
+    # Opção --compact-json (JSON sem indentação)
+    compact_json = "--compact-json" in args
+    if compact_json:
+        args.remove("--compact-json")
+    
+    # Opção --no-vector-scan (não procura gráficos vetoriais nas páginas sem imagens)
+    vector_graphics = "--no-vector-scan" not in args
+    if not vector_graphics:
+        args.remove("--no-vector-scan")
+    
+    # Opção --verbose (diagnóstico com análise dos elementos vetoriais)
+    verbose = "--verbose" in args
+    if verbose:
+        args.remove("--verbose")
+    
+    if len(args) < 1:
         print("\n💡 COMO USAR:")
         print(" python pdf_extractor.py <arquivo.pdf>                    # Extração completa")
         print(" python pdf_extractor.py <arquivo.pdf> <diretorio_saida>  # Com diretório customizado")
         print(" python pdf_extractor.py diagnose <arquivo.pdf>           # Diagnóstico de imagens")
+        print(f" python pdf_extractor.py <arquivo.pdf> --workers N       # N processos (padrão: {DEFAULT_WORKERS})")
+        print(" python pdf_extractor.py <arquivo.pdf> --compact-json    # JSON sem indentação")
+        print(" python pdf_extractor.py <arquivo.pdf> --no-vector-scan  # Sem busca de gráficos vetoriais")
+        print(" python pdf_extractor.py diagnose <arquivo.pdf> --verbose # Diagnóstico com elementos vetoriais")
         print("\nExemplos:")
         print(" python pdf_extractor.py documento.pdf")
         print(" python pdf_extractor.py documento.pdf C:/minha_pasta")
+        print(" python pdf_extractor.py documento.pdf --workers 1")
+        print(" python pdf_extractor.py documento.pdf --compact-json")
         print(" python pdf_extractor.py diagnose documento.pdf")
         return
 
     # Verificar se é comando de diagnóstico
-    if sys.argv[1].lower() == "diagnose" and len(sys.argv) > 2:
-        pdf_file = sys.argv[2]
+    if args[0].lower() == "diagnose" and len(args) > 1:
+        pdf_file = args[1]
         if not Path(pdf_file).exists():
             print(f"❌ Arquivo não encontrado: {pdf_file}")
             return
-        diagnose_pdf_images(pdf_file)
+        diagnose_pdf_images(pdf_file, verbose=verbose)
         return
 
-    pdf_file = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else "C:/extrair"
+    pdf_file = args[0]
+    output_dir = args[1] if len(args) > 1 else "C:/extrair"
     
     if not Path(pdf_file).exists():
         print(f"❌ Arquivo não encontrado: {pdf_file}")
         return
     
-    # Executar extração
-    print(f"\n🔍 Primeiro, vamos fazer um diagnóstico rápido...")
-    diagnose_pdf_images(pdf_file)
-    
-    print(f"\n🚀 Iniciando extração completa...")
-    extract_pdf_to_markdown(pdf_file, output_dir)
+    # Executar extração (com diagnóstico rápido no mesmo documento)
+    extract_pdf_to_markdown(pdf_file, output_dir, workers=workers, compact_json=compact_json,
+                            diagnose=True, vector_graphics=vector_graphics)
 
 
 if __name__ == "__main__":
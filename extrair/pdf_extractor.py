@@ -5,8 +5,11 @@ Foco na precisão e robustez
 """
 
 import json
+import os
 import sys
 import re
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 import datetime
 
@@ -18,16 +21,140 @@ except ImportError:
     print("❌ Execute: pip install PyMuPDF")
     sys.exit(1)
 
+# NumPy é opcional: compara todas as linhas H x V de uma vez; sem ele, laço em Python
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    NUMPY_AVAILABLE = False
+
+# orjson é opcional: serializa bem mais rápido; sem ele usamos json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Processos para analisar as páginas em paralelo no scan completo
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Documento aberto em cada processo do pool (ver _init_scan_worker)
+_worker_doc = None
+
+# Colorspaces convertidos para RGB antes de medir/gravar a imagem
+_NEEDS_RGB_CONVERT = frozenset({"DeviceN", "Separation", "Lab", "ICCBased"})
+
+# Componentes por pixel de cada colorspace, como o Pixmap da análise ficaria
+# (os de _NEEDS_RGB_CONVERT viram RGB); ICCBased é resolvido pelo /N do perfil
+_COLORSPACE_COMPONENTS = {"DeviceGray": 1, "DeviceRGB": 3, "DeviceCMYK": 4}
+_ICC_REF_RE = re.compile(r'/ICCBased\s+(\d+)\s+0\s+R')
+
+# Palavras-chave de gráfico (sem diferenciar maiúsculas; vale também dentro da palavra)
+_CHART_KEYWORDS = (
+    'gráfico', 'chart', 'figura', 'dados', 'média', 'total',
+    'evolução', 'tendência', 'comparação', '%', 'percentual'
+)
+
+# Uma varredura do texto classifica cada palavra (sequência sem espaços):
+# num = número isolado (label de eixo), kw = contém palavra-chave, senão palavra comum
+_TOKEN_RE = re.compile(
+    r'(?P<num>\d+(?:\.\d+)?(?!\S))'
+    r'|(?P<kw>\S*?(?:' + '|'.join(map(re.escape, _CHART_KEYWORDS)) + r')\S*)'
+    r'|\S+',
+    re.IGNORECASE
+)
+
+
+def _page_drawings(page) -> list:
+    """Caminhos vetoriais da página.
+    
+    get_cdrawings traz os mesmos caminhos e itens de get_drawings, mas com
+    tuplas no lugar de Point/Rect e sem montar os dicts completos: bem mais
+    barato. Versões antigas do PyMuPDF não o têm.
+    """
+    get_cdrawings = getattr(page, "get_cdrawings", None)
+    if get_cdrawings is not None:
+        return get_cdrawings()
+    return page.get_drawings()
+
+
+def _count_intersections(lines_h: list, lines_v: list) -> int:
+    """Conta os pares (horizontal, vertical) que se cruzam.
+    
+    lines_h traz tuplas (y, x_start, x_end) e lines_v, (x, y_start, y_end).
+    """
+    if not lines_h or not lines_v:
+        return 0
+    if NUMPY_AVAILABLE:
+        # Uma coluna por campo; a matriz H x V é avaliada de uma vez
+        H = np.array(lines_h, dtype=np.float32)
+        V = np.array(lines_v, dtype=np.float32)
+        inter = ((H[:, 1:2] <= V[:, 0]) & (V[:, 0] <= H[:, 2:3]) &
+                 (V[:, 1] <= H[:, 0:1]) & (H[:, 0:1] <= V[:, 2]))
+        return int(inter.sum())
+    # Sem NumPy: verticais ordenadas por x; cada horizontal só testa as que
+    # caem entre x_start e x_end (busca binária), e não todas
+    lines_v = sorted(lines_v)
+    xs = [line[0] for line in lines_v]
+    intersections = 0
+    for y, x_start, x_end in lines_h:
+        for j in range(bisect_left(xs, x_start), bisect_right(xs, x_end)):
+            if lines_v[j][1] <= y <= lines_v[j][2]:
+                intersections += 1
+    return intersections
+
+
+def _color_components(doc, img: tuple) -> int:
+    """Componentes por pixel de uma imagem de get_images(full=True), sem decodificá-la."""
+    name, alt = img[5], img[6]
+    if name in _COLORSPACE_COMPONENTS:
+        return _COLORSPACE_COMPONENTS[name]
+    if name == "ICCBased":
+        try:
+            kind, value = doc.xref_get_key(img[0], "ColorSpace")
+            if kind == "xref":
+                value = doc.xref_object(int(value.split()[0]))
+            match = _ICC_REF_RE.search(value)
+            if match:
+                n = doc.xref_get_key(int(match.group(1)), "N")[1]
+                if n.isdigit():
+                    return int(n)
+        except Exception:
+            pass
+    # Indexed usa o colorspace base; o resto é convertido para RGB
+    return _COLORSPACE_COMPONENTS.get(alt, 3)
+
 
 class PreciseChartDetector:
     """Detector preciso de gráficos com foco em padrões específicos."""
 
     @staticmethod
-    def analyze_page_for_charts(doc, page_num: int) -> dict:
-        """Análise completa de uma página para detectar gráficos."""
+    def analyze_page_for_charts(doc, page_num: int, save_dir: Path = None,
+                                page_data: dict = None, early_exit: bool = False) -> dict:
+        """Análise completa de uma página para detectar gráficos.
+        
+        Com save_dir, cada imagem da página é gravada lá (element_N.png). As
+        mensagens da página saem de uma vez só no stdout, ao final da análise.
+        page_data pode trazer "images" (get_images(full=True)), "drawings" e
+        "text" já obtidos da página, que então não são extraídos de novo.
+        Com early_exit, a análise de texto é pulada quando imagens e vetores não
+        pontuaram nada: só o texto (no máximo 0.35) não alcança 0.4, e a página
+        sai com score 0 e "early_exit": True.
+        """
+        messages = []
+        try:
+            return PreciseChartDetector._analyze_page(doc, page_num, save_dir, messages.append,
+                                                      page_data or {}, early_exit)
+        finally:
+            sys.stdout.write("\n".join(messages) + "\n")
+
+    @staticmethod
+    def _analyze_page(doc, page_num: int, save_dir: Path, log, page_data: dict,
+                      early_exit: bool) -> dict:
+        """Corpo de analyze_page_for_charts; log recebe cada mensagem."""
         page = doc[page_num]
-        print(f"\n🔍 Analisando página {page_num + 1}")
-        print(f"📐 Dimensões: {page.rect.width:.0f} x {page.rect.height:.0f}")
+        log(f"\n🔍 Analisando página {page_num + 1}")
+        log(f"📐 Dimensões: {page.rect.width:.0f} x {page.rect.height:.0f}")
 
         analysis = {
             "page_number": page_num + 1,
@@ -42,185 +169,193 @@ class PreciseChartDetector:
         }
 
         # 1. ANÁLISE DE IMAGENS
-        images = page.get_images(full=True)
+        images = page_data.get("images")
+        if images is None:
+            images = page.get_images(full=True)
         analysis["elements"]["images"]["count"] = len(images)
-        print(f"📸 Imagens encontradas: {len(images)}")
+        log(f"📸 Imagens encontradas: {len(images)}")
+        if save_dir is not None and images:
+            save_dir.mkdir(exist_ok=True)
 
         for i, img in enumerate(images):
             try:
-                pix = fitz.Pixmap(doc, img[0])
-                # Tratar colorspace problemático
-                if pix.colorspace and pix.colorspace.name in ["DeviceN", "Separation", "Lab", "ICCBased"]:
-                    pix_rgb = fitz.Pixmap(fitz.csRGB, pix)
-                    pix = pix_rgb
-
-                pixels = pix.width * pix.height
-                aspect = round(pix.width / pix.height, 2) if pix.height > 0 else 0
+                # A imagem só é decodificada (Pixmap) para ser gravada
+                if save_dir is not None:
+                    try:
+                        pix = fitz.Pixmap(doc, img[0])
+                        # Tratar colorspace problemático
+                        if pix.colorspace and pix.colorspace.name in _NEEDS_RGB_CONVERT:
+                            pix_rgb = fitz.Pixmap(fitz.csRGB, pix)
+                            pix = pix_rgb
+                        img_file = save_dir / f"element_{i+1}.png"
+                        pix.save(str(img_file))
+                        log(f"💾 Elemento salvo: {img_file}")
+                    except Exception as e:
+                        log(f"❌ Erro ao salvar elemento {i+1}: {e}")
+                    pix = None
+
+                # Dimensões declaradas no PDF (get_images), sem decodificar
+                width, height = img[2], img[3]
+                pixels = width * height
+                aspect = round(width / height, 2) if height > 0 else 0
                 img_detail = {
                     "index": i,
-                    "dimensions": f"{pix.width}x{pix.height}",
+                    "dimensions": f"{width}x{height}",
                     "pixels": pixels,
                     "aspect_ratio": aspect,
-                    "size_mb": round(len(pix.tobytes()) / 1024 / 1024, 3)
+                    # Tamanho dos pixels decodificados (sem codificar PNG só para medir)
+                    "size_mb": round(pixels * _color_components(doc, img) / 1024 / 1024, 3)
                 }
-                print(f" Img {i+1}: {img_detail['dimensions']} ({pixels:,} px, ratio: {aspect})")
+                log(f" Img {i+1}: {img_detail['dimensions']} ({pixels:,} px, ratio: {aspect})")
 
                 # Classificar imagem
                 if pixels > 100000:  # Grande
                     analysis["elements"]["images"]["large_count"] += 1
                     img_detail["category"] = "large"
 
-                    # Características típicas de gráfico
-                    chart_features = 0
-                    if 50000 <= pixels <= 800000:  # Tamanho típico de gráfico
-                        chart_features += 1
-                    if 0.6 <= aspect <= 2.5:  # Proporção típica
-                        chart_features += 1
-                    if pix.width > 300 and pix.height > 200:  # Dimensões substanciais
-                        chart_features += 1
+                    # Características típicas de gráfico (cada uma vale 1)
+                    chart_features = ((50000 <= pixels <= 800000)       # Tamanho típico de gráfico
+                                      + (0.6 <= aspect <= 2.5)          # Proporção típica
+                                      + (width > 300 and height > 200))  # Dimensões substanciais
                     img_detail["chart_features"] = chart_features
 
                     if chart_features >= 2:
-                        print(f" 🎯 FORTE CANDIDATO A GRÁFICO! ({chart_features}/3 características)")
+                        log(f" 🎯 FORTE CANDIDATO A GRÁFICO! ({chart_features}/3 características)")
                         analysis["chart_score"] += 0.4
                         analysis["indicators"].append(f"large_chart_image_{i+1}")
                 elif pixels > 20000:
                     img_detail["category"] = "medium"
-                    print(f" 📊 Possível gráfico médio")
+                    log(f" 📊 Possível gráfico médio")
                     analysis["chart_score"] += 0.2
                 else:
                     img_detail["category"] = "small"
-                    print(f" 🔸 Imagem pequena")
+                    log(f" 🔸 Imagem pequena")
 
                 analysis["elements"]["images"]["details"].append(img_detail)
-                pix = None
             except Exception as e:
-                print(f" ❌ Erro na imagem {i}: {e}")
+                log(f" ❌ Erro na imagem {i}: {e}")
                 analysis["elements"]["images"]["details"].append({
                     "index": i, "error": str(e)
                 })
 
         # 2. ANÁLISE DE ELEMENTOS VETORIAIS
-        drawings = page.get_drawings()
+        drawings = page_data.get("drawings")
+        if drawings is None:
+            drawings = _page_drawings(page)
         analysis["elements"]["vectors"]["count"] = len(drawings)
-        print(f"🎨 Elementos vetoriais: {len(drawings)}")
+        log(f"🎨 Elementos vetoriais: {len(drawings)}")
 
+        # Linhas como tuplas (sem dict por linha): H = (y, x_start, x_end), V = (x, y_start, y_end)
         all_lines_h = []
         all_lines_v = []
-        rectangles = []
-
-        for drawing in drawings:
-            items = drawing.get("items", [])
-            for item in items:
-                if not item or len(item) < 2:
-                    continue
-                item_type = item[0]
-                coords = item[1]
-                if item_type == "l" and len(coords) >= 4:  # Linha
-                    x1, y1, x2, y2 = coords[0], coords[1], coords[2], coords[3]
-                    dx, dy = abs(x2 - x1), abs(y2 - y1)
-                    length = (dx**2 + dy**2)**0.5
-                    if dy < 5 and dx > 30:  # Linha horizontal
-                        all_lines_h.append({
-                            "y": round((y1 + y2) / 2, 1),
-                            "x_start": round(min(x1, x2), 1),
-                            "x_end": round(max(x1, x2), 1),
-                            "length": round(length, 1)
-                        })
-                        analysis["elements"]["vectors"]["lines_h"] += 1
-                    elif dx < 5 and dy > 30:  # Linha vertical
-                        all_lines_v.append({
-                            "x": round((x1 + x2) / 2, 1),
-                            "y_start": round(min(y1, y2), 1),
-                            "y_end": round(max(y1, y2), 1),
-                            "length": round(length, 1)
-                        })
-                        analysis["elements"]["vectors"]["lines_v"] += 1
-                elif item_type == "re":  # Retângulo
-                    rectangles.append(coords)
-                    analysis["elements"]["vectors"]["rectangles"] += 1
 
-        print(f" Linhas H: {len(all_lines_h)}, V: {len(all_lines_v)}, Retângulos: {len(rectangles)}")
+        # Itens separados por tipo de uma vez; retângulos só são contados
+        items = [item for drawing in drawings for item in drawing.get("items", ()) if len(item) >= 2]
+        rectangles = sum(1 for item in items if item[0] == "re")
+        for item in items:
+            if item[0] != "l":  # Só linhas daqui em diante
+                continue
+            coords = item[1]
+            if len(coords) >= 4:
+                x1, y1, x2, y2 = coords[0], coords[1], coords[2], coords[3]
+            elif len(item) >= 3:  # ("l", p1, p2), formato do get_(c)drawings
+                (x1, y1), (x2, y2) = coords, item[2]
+            else:
+                continue
+            dx, dy = abs(x2 - x1), abs(y2 - y1)
+            if dy < 5 and dx > 30:  # Linha horizontal
+                all_lines_h.append((round((y1 + y2) / 2, 1), round(min(x1, x2), 1),
+                                    round(max(x1, x2), 1)))
+            elif dx < 5 and dy > 30:  # Linha vertical
+                all_lines_v.append((round((x1 + x2) / 2, 1), round(min(y1, y2), 1),
+                                    round(max(y1, y2), 1)))
+
+        vectors = analysis["elements"]["vectors"]
+        vectors["lines_h"] = len(all_lines_h)
+        vectors["lines_v"] = len(all_lines_v)
+        vectors["rectangles"] = rectangles
+        log(f" Linhas H: {len(all_lines_h)}, V: {len(all_lines_v)}, Retângulos: {rectangles}")
 
         # 3. DETECTAR PADRÕES DE EIXOS
         axes_detected = False
         grid_detected = False
 
         # Eixos perpendiculares
-        intersections = 0
-        for h_line in all_lines_h:
-            for v_line in all_lines_v:
-                # Verificar interseção
-                if (h_line["x_start"] <= v_line["x"] <= h_line["x_end"] and
-                        v_line["y_start"] <= h_line["y"] <= v_line["y_end"]):
-                    intersections += 1
+        intersections = _count_intersections(all_lines_h, all_lines_v)
 
         if intersections > 0:
             axes_detected = True
             analysis["chart_score"] += 0.3
             analysis["indicators"].append("perpendicular_axes")
-            print(f" 🎯 Eixos perpendiculares detectados! ({intersections} interseções)")
+            log(f" 🎯 Eixos perpendiculares detectados! ({intersections} interseções)")
 
         # Grade (múltiplas linhas paralelas)
         if len(all_lines_h) >= 3 and len(all_lines_v) >= 2:
             grid_detected = True
             analysis["chart_score"] += 0.25
             analysis["indicators"].append("grid_pattern")
-            print(f" 📊 Grade detectada!")
+            log(f" 📊 Grade detectada!")
 
         # Padrão de barras
-        if len(rectangles) >= 3:
+        if rectangles >= 3:
             analysis["chart_score"] += 0.2
             analysis["indicators"].append("bar_pattern")
-            print(f" 📊 Padrão de barras detectado!")
+            log(f" 📊 Padrão de barras detectado!")
 
-        # 4. ANÁLISE DE TEXTO
-        text = page.get_text()
-        words = text.split() if text else []
-        analysis["elements"]["text"]["total_words"] = len(words)
+        # Sem pontos de imagem/vetores nem imagem grande, o texto não leva a página a candidata
+        if (early_exit and analysis["chart_score"] == 0
+                and analysis["elements"]["images"]["large_count"] == 0):
+            log(f" ⏭️ Sem imagens ou padrões vetoriais relevantes - texto não analisado")
+            analysis["early_exit"] = True
+            return PreciseChartDetector._conclude(analysis, log)
 
-        # Detectar números isolados (labels de eixo)
+        # 4. ANÁLISE DE TEXTO
+        text = page_data.get("text")
+        if text is None:
+            text = page.get_text()
+        # Números isolados (labels de eixo) e palavras-chave numa única passada
+        total_words = 0
         numbers = []
-        for word in words:
-            if re.match(r'^\d+(\.\d+)?$', word):
-                numbers.append(word)
+        keywords_found = {}  # dict como conjunto ordenado: sem repetições, na ordem do texto
+        for match in _TOKEN_RE.finditer(text):
+            total_words += 1
+            kind = match.lastgroup
+            if kind == "num":
+                numbers.append(match.group())
+            elif kind == "kw":
+                keywords_found[match.group()] = None
+        analysis["elements"]["text"]["total_words"] = total_words
         analysis["elements"]["text"]["numbers"] = numbers
+        keywords_found = list(keywords_found)
+        analysis["elements"]["text"]["keywords"] = keywords_found
 
-        # Palavras-chave de gráfico
-        chart_keywords = [
-            'gráfico', 'chart', 'figura', 'dados', 'média', 'total',
-            'evolução', 'tendência', 'comparação', '%', 'percentual'
-        ]
-        keywords_found = []
-        for word in words:
-            for keyword in chart_keywords:
-                if keyword.lower() in word.lower():
-                    keywords_found.append(word)
-        analysis["elements"]["text"]["keywords"] = list(set(keywords_found))
-
-        print(f"📝 Texto: {len(words)} palavras, {len(numbers)} números")
+        log(f"📝 Texto: {total_words} palavras, {len(numbers)} números")
         if len(numbers) >= 4:
             analysis["chart_score"] += 0.15
             analysis["indicators"].append("numeric_labels")
-            print(f" 🔢 Labels numéricos: {', '.join(numbers[:8])}")
+            log(f" 🔢 Labels numéricos: {', '.join(numbers[:8])}")
         if keywords_found:
             analysis["chart_score"] += 0.1
             analysis["indicators"].append("chart_keywords")
-            print(f" 🏷️ Palavras-chave: {', '.join(keywords_found[:5])}")
+            log(f" 🏷️ Palavras-chave: {', '.join(keywords_found[:5])}")
         # Percentuais
         if '%' in text or 'percent' in text.lower():
             analysis["chart_score"] += 0.1
             analysis["indicators"].append("percentages")
-            print(f" 📊 Percentuais detectados")
+            log(f" 📊 Percentuais detectados")
 
         # 5. ANÁLISE DE LAYOUT
         # Páginas de gráfico tendem a ter pouco texto
-        if len(words) < 100 and (axes_detected or analysis["elements"]["images"]["large_count"] > 0):
+        if total_words < 100 and (axes_detected or analysis["elements"]["images"]["large_count"] > 0):
             analysis["chart_score"] += 0.15
             analysis["indicators"].append("minimal_text_page")
-            print(f" 📄 Layout típico de página de gráfico (pouco texto)")
+            log(f" 📄 Layout típico de página de gráfico (pouco texto)")
 
-        # 6. CONCLUSÃO
+        return PreciseChartDetector._conclude(analysis, log)
+
+    @staticmethod
+    def _conclude(analysis: dict, log) -> dict:
+        """6. CONCLUSÃO: fecha o score e a confiança da análise."""
         final_score = round(min(analysis["chart_score"], 1.0), 3)
         analysis["chart_score"] = final_score
         if final_score >= 0.7:
@@ -233,63 +368,102 @@ class PreciseChartDetector:
             analysis["conclusion"] = "BAIXA probabilidade de gráfico"
             confidence = "low"
         analysis["confidence"] = confidence
-        print(f"📊 SCORE FINAL: {final_score}")
-        print(f"🎯 {analysis['conclusion']}")
+        log(f"📊 SCORE FINAL: {final_score}")
+        log(f"🎯 {analysis['conclusion']}")
         return analysis
 
 
-def analyze_specific_page(file_path: str, page_number: int, save_images: bool = True):
-    """Análise focada em uma página específica."""
+def _save_json(path: Path, data: dict):
+    """Grava o JSON numa única serialização; default=str converte o que não for serializável."""
+    if ORJSON_AVAILABLE:
+        with open(path, 'wb') as f:
+            f.write(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+                                 default=str))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+
+
+def _scan_page(doc, page_num: int) -> dict:
+    """Analisa uma página do scan completo."""
+    print(f"\n📄 Página {page_num + 1}:")
+    return PreciseChartDetector.analyze_page_for_charts(doc, page_num, early_exit=True)
+
+
+def _init_scan_worker(file_path: str):
+    """Abre o PDF uma vez por processo do pool; o documento não pode ser enviado entre processos."""
+    global _worker_doc
+    _worker_doc = fitz.open(file_path)
+
+
+def _scan_page_worker(page_num: int) -> dict:
+    """Analisa uma página usando o documento aberto neste processo."""
+    analysis = _scan_page(_worker_doc, page_num)
+    # As mensagens de uma página saem juntas, sem misturar com as de outro processo
+    sys.stdout.flush()
+    return analysis
+
+
+def _iter_analyses(doc, file_path: str, workers: int):
+    """Gera a análise das páginas em ordem, em paralelo quando workers > 1."""
+    if workers > 1 and len(doc) > 1:
+        print(f"⚙️ Analisando páginas em paralelo ({workers} processos)")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_scan_worker,
+                                 initargs=(file_path,)) as executor:
+            # map devolve na ordem das páginas, conforme ficam prontas
+            yield from executor.map(_scan_page_worker, range(len(doc)))
+    else:
+        for page_num in range(len(doc)):
+            yield _scan_page(doc, page_num)
+
+
+def analyze_specific_page(file_path: str, page_number: int, save_images: bool = True,
+                          doc=None, page_data: dict = None):
+    """Análise focada em uma página específica.
+    
+    Aceita o documento já aberto (doc), que então não é fechado aqui, e os
+    dados da página já extraídos (page_data, ver analyze_page_for_charts).
+    """
     print(f"🎯 ANÁLISE ESPECÍFICA - PÁGINA {page_number}")
     print(f"📄 Arquivo: {Path(file_path).name}")
+    owns_doc = doc is None
     try:
-        doc = fitz.open(file_path)
+        if owns_doc:
+            doc = fitz.open(file_path)
         if page_number > len(doc) or page_number < 1:
             print(f"❌ Página {page_number} não existe (total: {len(doc)})")
             return
 
-        # Análise da página
-        result = PreciseChartDetector.analyze_page_for_charts(doc, page_number - 1)
-
-        # Salvar imagens se solicitado
-        if save_images and result["elements"]["images"]["count"] > 0:
-            page = doc[page_number - 1]
-            output_dir = Path(file_path).parent / f"page_{page_number}_elements"
-            output_dir.mkdir(exist_ok=True)
-            images = page.get_images(full=True)
-            for i, img in enumerate(images):
-                try:
-                    pix = fitz.Pixmap(doc, img[0])
-                    if pix.colorspace and pix.colorspace.name in ["DeviceN", "Separation", "Lab", "ICCBased"]:
-                        pix_rgb = fitz.Pixmap(fitz.csRGB, pix)
-                        pix = pix_rgb
-                    img_file = output_dir / f"element_{i+1}.png"
-                    pix.save(str(img_file))
-                    print(f"💾 Elemento salvo: {img_file}")
-                    pix = None
-                except Exception as e:
-                    print(f"❌ Erro ao salvar elemento {i+1}: {e}")
+        # Análise da página (salvando as imagens na mesma passada, se solicitado)
+        output_dir = Path(file_path).parent / f"page_{page_number}_elements" if save_images else None
+        result = PreciseChartDetector.analyze_page_for_charts(doc, page_number - 1, output_dir,
+                                                              page_data)
 
         # Salvar análise
         analysis_file = Path(file_path).parent / f"chart_analysis_page_{page_number}.json"
-        # Garantir que tudo é serializável
-        clean_result = json.loads(json.dumps(result, default=str))
-        with open(analysis_file, 'w', encoding='utf-8') as f:
-            json.dump(clean_result, f, indent=2, ensure_ascii=False)
+        _save_json(analysis_file, result)
         print(f"\n💾 Análise salva em: {analysis_file}")
-        doc.close()
         return result
     except Exception as e:
         print(f"❌ Erro: {e}")
         return None
+    finally:
+        if owns_doc and doc is not None:
+            doc.close()
 
 
-def scan_all_pages(file_path: str):
-    """Escaneia todas as páginas procurando gráficos."""
+def scan_all_pages(file_path: str, workers: int = DEFAULT_WORKERS, doc=None):
+    """Escaneia todas as páginas procurando gráficos.
+    
+    Com workers > 1 as páginas são analisadas em paralelo, em processos separados.
+    Aceita o documento já aberto (doc), que então não é fechado aqui.
+    """
     print(f"🔍 ESCANEANDO TODO O DOCUMENTO")
     print(f"📄 Arquivo: {Path(file_path).name}")
+    owns_doc = doc is None
     try:
-        doc = fitz.open(file_path)
+        if owns_doc:
+            doc = fitz.open(file_path)
         print(f"📊 Total de páginas: {len(doc)}")
         results = {
             "document": Path(file_path).name,
@@ -303,9 +477,7 @@ def scan_all_pages(file_path: str):
         }
 
         # Analisar cada página
-        for page_num in range(len(doc)):
-            print(f"\n📄 Página {page_num + 1}:")
-            analysis = PreciseChartDetector.analyze_page_for_charts(doc, page_num)
+        for page_num, analysis in enumerate(_iter_analyses(doc, file_path, workers)):
             page_key = f"page_{page_num + 1}"
             results["pages"][page_key] = analysis
             # Se tem alta probabilidade, adicionar aos candidatos
@@ -332,24 +504,26 @@ def scan_all_pages(file_path: str):
 
         # Salvar resultado
         output_file = Path(file_path).parent / f"scan_completo_{Path(file_path).stem}.json"
-        # Garantir serialização
-        clean_results = json.loads(json.dumps(results, default=str))
-        with open(output_file, 'w', encoding='utf-8') as f:
-            json.dump(clean_results, f, indent=2, ensure_ascii=False)
+        _save_json(output_file, results)
         print(f"\n💾 Scan completo salvo em: {output_file}")
-        doc.close()
         return results
     except Exception as e:
         print(f"❌ Erro no scan: {e}")
         return None
+    finally:
+        if owns_doc and doc is not None:
+            doc.close()
 
 
-def extract_page_4_optimized(file_path: str):
-    """Extração otimizada especificamente para página 4."""
+def extract_page_4_optimized(file_path: str, doc=None):
+    """Extração otimizada especificamente para página 4.
+    
+    Aceita o documento já aberto (doc), repassado à análise da página.
+    """
     print("🎯 EXTRAÇÃO OTIMIZADA - PÁGINA 4")
     print("Focando em detectar o gráfico que você mencionou...")
     # Primeiro, análise rápida
-    result = analyze_specific_page(file_path, 4, save_images=True)
+    result = analyze_specific_page(file_path, 4, save_images=True, doc=doc)
     if result and result.get("chart_score", 0) >= 0.3:
         print(f"\n✅ GRÁFICO DETECTADO NA PÁGINA 4!")
         print(f" Score: {result['chart_score']}")
@@ -379,25 +553,47 @@ def extract_page_4_optimized(file_path: str):
 def main():
     """Função principal com comandos específicos."""
     print("🚀 Detector Preciso de Gráficos")
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+
+    # Opção --workers N (processos para o scan completo)
+    workers = DEFAULT_WORKERS
+    if "--workers" in args:
+        idx = args.index("--workers")
+        try:
+            workers = int(args[idx + 1])
+        except (IndexError, ValueError):
+            print("❌ --workers requer um número inteiro")
+            return
+        del args[idx:idx + 2]
+
+    if len(args) < 1:
         print("\n💡 COMANDOS DISPONÍVEIS:")
         print(" python detector.py <arquivo.pdf> # Scan completo")
         print(" python detector.py page4 <arquivo.pdf> # Foco na página 4")
         print(" python detector.py page <arquivo.pdf> <N> # Página específica")
         print(" python detector.py scan <arquivo.pdf> # Scan detalhado")
+        print(f" python detector.py scan <arquivo.pdf> --workers N # N processos (padrão: {DEFAULT_WORKERS})")
         return
 
-    command = sys.argv[1]
-    if command == "page4" and len(sys.argv) > 2:
-        pdf_file = sys.argv[2]
-        extract_page_4_optimized(pdf_file)
-    elif command == "page" and len(sys.argv) > 3:
-        pdf_file = sys.argv[2]
-        page_num = int(sys.argv[3])
+    command = args[0]
+    if command == "page4" and len(args) > 1:
+        pdf_file = args[1]
+        try:
+            with fitz.open(pdf_file) as doc:
+                extract_page_4_optimized(pdf_file, doc=doc)
+        except Exception as e:
+            print(f"❌ Erro: {e}")
+    elif command == "page" and len(args) > 2:
+        pdf_file = args[1]
+        page_num = int(args[2])
         analyze_specific_page(pdf_file, page_num)
-    elif command == "scan" and len(sys.argv) > 2:
-        pdf_file = sys.argv[2]
-        scan_all_pages(pdf_file)
+    elif command == "scan" and len(args) > 1:
+        pdf_file = args[1]
+        try:
+            with fitz.open(pdf_file) as doc:
+                scan_all_pages(pdf_file, workers, doc=doc)
+        except Exception as e:
+            print(f"❌ Erro: {e}")
     else:
         # Comando padrão - scan rápido
         pdf_file = command
@@ -406,45 +602,56 @@ def main():
             return
         print(f"\n📄 Scan rápido: {Path(pdf_file).name}")
         try:
-            doc = fitz.open(pdf_file)
-            # Verificar cada página rapidamente
-            chart_candidates = []
-            for page_num in range(len(doc)):
-                page = doc[page_num]
-                # Análise rápida
-                images = len(page.get_images())
-                drawings = len(page.get_drawings())
-                text_words = len(page.get_text().split())
-                score = 0
-                if images > 0 and images <= 3:  # Poucas imagens grandes
-                    score += 0.3
-                if drawings > 5:  # Muitos elementos vetoriais
-                    score += 0.3
-                if text_words < 150:  # Pouco texto
-                    score += 0.2
-                if score >= 0.4:
-                    chart_candidates.append({
-                        "page": page_num + 1,
-                        "score": round(score, 2),
-                        "images": images,
-                        "vectors": drawings,
-                        "words": text_words
-                    })
-
-            print(f"\n📊 CANDIDATOS A GRÁFICO:")
-            if chart_candidates:
-                chart_candidates.sort(key=lambda x: x["score"], reverse=True)
-                for candidate in chart_candidates:
-                    print(f" 📄 Página {candidate['page']}: score {candidate['score']}")
-                    print(f" 📸 {candidate['images']} img, 🎨 {candidate['vectors']} vetores, 📝 {candidate['words']} palavras")
-                # Análise detalhada da melhor
-                best = chart_candidates[0]
-                print(f"\n🔍 Analisando melhor candidato (página {best['page']})...")
-                analyze_specific_page(pdf_file, best["page"], save_images=True)
-            else:
-                print(" ❓ Nenhum candidato óbvio encontrado")
-                print(" Tente: python detector.py scan arquivo.pdf")
-            doc.close()
+            with fitz.open(pdf_file) as doc:
+                # Verificar cada página rapidamente
+                chart_candidates = []
+                # Dados já extraídos do melhor candidato até aqui, reaproveitados na análise detalhada
+                best_score = None
+                best_data = None
+                for page_num in range(len(doc)):
+                    page = doc[page_num]
+                    # Análise rápida
+                    page_data = {
+                        "images": page.get_images(full=True),
+                        "drawings": _page_drawings(page),
+                        "text": page.get_text()
+                    }
+                    images = len(page_data["images"])
+                    drawings = len(page_data["drawings"])
+                    text_words = len(page_data["text"].split())
+                    score = 0
+                    if images > 0 and images <= 3:  # Poucas imagens grandes
+                        score += 0.3
+                    if drawings > 5:  # Muitos elementos vetoriais
+                        score += 0.3
+                    if text_words < 150:  # Pouco texto
+                        score += 0.2
+                    if score >= 0.4:
+                        chart_candidates.append({
+                            "page": page_num + 1,
+                            "score": round(score, 2),
+                            "images": images,
+                            "vectors": drawings,
+                            "words": text_words
+                        })
+                        if best_score is None or round(score, 2) > best_score:
+                            best_score = round(score, 2)
+                            best_data = page_data
+
+                print(f"\n📊 CANDIDATOS A GRÁFICO:")
+                if chart_candidates:
+                    chart_candidates.sort(key=lambda x: x["score"], reverse=True)
+                    for candidate in chart_candidates:
+                        print(f" 📄 Página {candidate['page']}: score {candidate['score']}")
+                        print(f" 📸 {candidate['images']} img, 🎨 {candidate['vectors']} vetores, 📝 {candidate['words']} palavras")
+                    # Análise detalhada da melhor
+                    best = chart_candidates[0]
+                    print(f"\n🔍 Analisando melhor candidato (página {best['page']})...")
+                    analyze_specific_page(pdf_file, best["page"], save_images=True,
+                                          doc=doc, page_data=best_data)
+                else:
+                    print(" ❓ Nenhum candidato óbvio encontrado")
+                    print(" Tente: python detector.py scan arquivo.pdf")
         except Exception as e:
             print(f"❌ Erro: {e}")
 
@@ -4,9 +4,13 @@ Extrator de PDF para Markdown - Versão Adaptada
 Foco na extração completa de conteúdo e salvamento em markdown
 """
 
+import io
 import json
+import os
 import sys
 import re
+import statistics
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import datetime
 
@@ -18,13 +22,58 @@ except ImportError:
     print("❌ Execute: pip install PyMuPDF")
     sys.exit(1)
 
+# orjson é opcional: serializa bem mais rápido; sem ele usamos json
+try:
+    import orjson
+    ORJSON_AVAILABLE = True
+except ImportError:
+    ORJSON_AVAILABLE = False
+
+# Processos para extrair páginas em paralelo (cada página é independente)
+DEFAULT_WORKERS = min(os.cpu_count() or 1, 4)
+
+# Documento e dados da extração em cada processo do pool (ver _init_page_worker)
+_worker_doc = None
+_worker_first_images = None
+_worker_image_dir = None
+
+# Gravação das imagens em threads, sobrepondo o disco com a extração das páginas
+_image_writer = None
+_pending_writes = []
+
+# Dict de texto sem as imagens embutidas: elas são extraídas à parte, na etapa 3
+_TEXT_DICT_FLAGS = fitz.TEXTFLAGS_DICT & ~fitz.TEXT_PRESERVE_IMAGES
+
+# Padrões compilados uma vez, fora do laço de linhas/blocos
+_TABLE_RE = re.compile(r'\d+\s+\d+\s+\d+')
+_BLANKLINE_RE = re.compile(r'\n\s*\n')
+
+# Colorspaces que o PNG grava direto: Gray (1) e RGB (3), inclusive os ICCBased
+# equivalentes; o resto (CMYK, Lab, DeviceN, ...) vira RGB
+_PNG_COLORSPACES = frozenset({1, 3})
+_PNG_COLORSPACE_NAMES = frozenset({"DeviceGray", "DeviceRGB"})
+_PNG_ICC_PREFIXES = ("ICCBased(Gray", "ICCBased(RGB")
+
+# Cabeçalho: fonte ao menos 30% maior que a mediana da página, ou bloco curto com palavra-chave
+_HEADING_SIZE_RATIO = 1.3
+_HEADING_KEYWORDS = ("CONFIDENTIAL", "MEMORANDUM", "FUND", "NOTICE", "REGULATORY")
+
 
 class PDFToMarkdownExtractor:
     """Extrator completo de PDF para Markdown com análise de estrutura."""
 
     @staticmethod
-    def extract_page_content(doc, page_num: int) -> dict:
-        """Extração completa do conteúdo de uma página."""
+    def extract_page_content(doc, page_num: int, first_images: dict = None,
+                             output_dir: Path = None) -> dict:
+        """Extração completa do conteúdo de uma página.
+        
+        first_images (xref -> (página, índice), ver _first_image_occurrences) indica
+        onde cada imagem aparece pela primeira vez no documento: uma imagem repetida
+        (logo, cabeçalho) só é extraída lá; nas demais ocorrências fica um marcador
+        {"index", "repeat_of": xref}, completado por _resolve_repeated_images.
+        output_dir é o diretório de imagens já preparado (ver prepare_image_dir);
+        sem ele, o diretório é preparado nesta chamada.
+        """
         page = doc[page_num]
         print(f"\n🔍 Extraindo página {page_num + 1}")
         print(f"📐 Dimensões: {page.rect.width:.0f} x {page.rect.height:.0f}")
@@ -59,50 +108,91 @@ class PDFToMarkdownExtractor:
             }
         }
 
-        # 1. EXTRAÇÃO DE TEXTO BRUTO
+        # Atalhos para as seções de content, usadas ao longo de toda a extração
+        text_info = content["text"]
+        images_info = content["images"]
+        structure = content["structure"]
+        metadata = content["metadata"]
+        formatted_blocks = text_info["formatted_blocks"]
+        headings = structure["headings"]
+        paragraphs = structure["paragraphs"]
+        image_details = images_info["details"]
+        extracted_paths = images_info["extracted_paths"]
+
+        # 1. EXTRAÇÃO DE TEXTO BRUTO (uma única leitura do conteúdo da página)
+        blocks = []
         try:
-            raw_text = page.get_text()
-            content["text"]["raw_text"] = raw_text.strip()
-            content["text"]["word_count"] = len(raw_text.split()) if raw_text else 0
-            content["text"]["has_content"] = bool(raw_text.strip())
-            print(f"📝 Texto extraído: {content['text']['word_count']} palavras")
+            # Página sem nenhuma fonte (digitalizada, só imagens) não tem texto: a
+            # lista de fontes sai dos recursos, sem interpretar o conteúdo da página.
+            # Anotações e campos de formulário usam as fontes das próprias aparências,
+            # fora dos recursos da página: se houver algum, o texto é lido sempre
+            if page.get_fonts() or page.first_annot or page.first_widget:
+                text_dict = page.get_text("dict", flags=_TEXT_DICT_FLAGS)
+                blocks = text_dict.get("blocks", [])
+            # Texto bruto montado das linhas do dict, como o page.get_text()
+            raw_text = "\n".join(
+                "".join(span.get("text", "") for span in line.get("spans", []))
+                for block in blocks if "lines" in block
+                for line in block["lines"]
+            ).strip()  # Aparado uma vez só; as etapas seguintes usam este mesmo texto
+            text_info["raw_text"] = raw_text
+            text_info["word_count"] = len(raw_text.split())
+            text_info["has_content"] = bool(raw_text)
+            print(f"📝 Texto extraído: {text_info['word_count']} palavras")
         except Exception as e:
             print(f"❌ Erro na extração de texto: {e}")
-            content["text"]["raw_text"] = f"[ERRO NA EXTRAÇÃO: {e}]"
+            text_info["raw_text"] = f"[ERRO NA EXTRAÇÃO: {e}]"
 
-        # 2. EXTRAÇÃO DE TEXTO ESTRUTURADO
+        # 2. EXTRAÇÃO DE TEXTO ESTRUTURADO (mesmos blocos da etapa 1)
+        if not text_info["has_content"]:
+            blocks = []  # Nada a classificar
         try:
-            text_dict = page.get_text("dict")
-            blocks = text_dict.get("blocks", [])
-            
+            # Texto e maior fonte de cada bloco; os tamanhos de todos os spans
+            # dão a fonte típica da página
+            pending = []
+            span_sizes = []
             for block in blocks:
                 if "lines" in block:  # Bloco de texto
                     block_text = ""
+                    max_size = 0
                     for line in block["lines"]:
                         for span in line.get("spans", []):
                             text = span.get("text", "").strip()
                             if text:
                                 block_text += text + " "
+                                size = span.get("size", 0)
+                                span_sizes.append(size)
+                                max_size = max(max_size, size)
                     
                     if block_text.strip():
-                        # Classificar tipo de bloco
-                        block_info = {
-                            "text": block_text.strip(),
-                            "bbox": block.get("bbox", []),
-                            "type": "paragraph"
-                        }
-                        
-                        # Detectar cabeçalhos (texto em maiúsculo, fonte maior, etc.)
-                        if block_text.isupper() or len(block_text) < 100:
-                            if any(word in block_text.upper() for word in 
-                                  ["CONFIDENTIAL", "MEMORANDUM", "FUND", "NOTICE", "REGULATORY"]):
-                                block_info["type"] = "heading"
-                                content["structure"]["headings"].append(block_text.strip())
-                        
-                        content["text"]["formatted_blocks"].append(block_info)
-                        
-                        if block_info["type"] == "paragraph":
-                            content["structure"]["paragraphs"].append(block_text.strip())
+                        pending.append((block_text, block.get("bbox", []), max_size))
+            
+            # Limite de fonte de cabeçalho, calculado uma vez para a página
+            heading_size = statistics.median(span_sizes) * _HEADING_SIZE_RATIO if span_sizes else 0
+            
+            for block_text, bbox, max_size in pending:
+                # Classificar tipo de bloco
+                block_info = {
+                    "text": block_text.strip(),
+                    "bbox": bbox,
+                    "type": "paragraph"
+                }
+                
+                # Detectar cabeçalhos: fonte maior que a da página, ou texto curto
+                # (ou em maiúsculo) com palavra-chave, com um único upper()
+                if max_size >= heading_size:
+                    block_info["type"] = "heading"
+                elif len(block_text) < 100 or block_text.isupper():
+                    upper = block_text.upper()
+                    if any(word in upper for word in _HEADING_KEYWORDS):
+                        block_info["type"] = "heading"
+                
+                formatted_blocks.append(block_info)
+                
+                if block_info["type"] == "heading":
+                    headings.append(block_info["text"])
+                else:
+                    paragraphs.append(block_info["text"])
 
         except Exception as e:
             print(f"❌ Erro na extração estruturada: {e}")
@@ -110,52 +200,66 @@ class PDFToMarkdownExtractor:
         # 3. EXTRAÇÃO DE IMAGENS
         try:
             images = page.get_images(full=True)
-            content["images"]["count"] = len(images)
+            images_info["count"] = len(images)
             print(f"📸 Imagens encontradas: {len(images)}")
 
-            output_dir = Path("C:/extrair/extracted_images")
-            output_dir.mkdir(parents=True, exist_ok=True)
+            if output_dir is None:
+                output_dir = prepare_image_dir()
 
             for i, img in enumerate(images):
+                # Imagem extraída na sua primeira ocorrência: só marcar a referência
+                first_page, first_index = (first_images or {}).get(img[0], (page_num, i))
+                if (first_page, first_index) != (page_num, i):
+                    image_details.append({"index": i + 1, "repeat_of": img[0]})
+                    print(f" ♻️ Imagem repetida (xref {img[0]}): extraída na página {first_page + 1}")
+                    continue
+                
                 try:
                     pix = fitz.Pixmap(doc, img[0])
                     
-                    # Tratar colorspace problemático
-                    if pix.colorspace and pix.colorspace.name in ["DeviceN", "Separation", "Lab", "ICCBased"]:
-                        pix_rgb = fitz.Pixmap(fitz.csRGB, pix)
-                        pix = pix_rgb
+                    # Tratar colorspace problemático: converter só o que o PNG não aceita.
+                    # Gray e RGB, inclusive ICCBased, seguem como estão; Lab também tem
+                    # 3 componentes, por isso o nome é conferido além da contagem
+                    colorspace = pix.colorspace
+                    if colorspace and (colorspace.n not in _PNG_COLORSPACES or not (
+                            colorspace.name in _PNG_COLORSPACE_NAMES
+                            or colorspace.name.startswith(_PNG_ICC_PREFIXES))):
+                        pix = fitz.Pixmap(fitz.csRGB, pix)  # O original é liberado com a referência
 
                     pixels = pix.width * pix.height
                     aspect = round(pix.width / pix.height, 2) if pix.height > 0 else 0
                     
+                    # PNG codificado uma vez só: o tamanho e o arquivo saem dos mesmos bytes
+                    png_data = pix.tobytes("png")
+                    
                     img_detail = {
                         "index": i + 1,
                         "dimensions": f"{pix.width}x{pix.height}",
                         "pixels": pixels,
                         "aspect_ratio": aspect,
-                        "size_mb": round(len(pix.tobytes()) / 1024 / 1024, 3),
+                        "size_mb": round(len(png_data) / 1024 / 1024, 3),
                         "filename": f"page_{page_num + 1}_image_{i + 1}.png"
                     }
                     
                     # Salvar imagem
                     img_file = output_dir / img_detail["filename"]
-                    pix.save(str(img_file))
-                    content["images"]["extracted_paths"].append(str(img_file))
+                    _submit_image_write(img_file, png_data)
+                    extracted_paths.append(str(img_file))
                     
                     # Classificar se pode ser gráfico
                     if pixels > 50000 and 0.5 <= aspect <= 3.0:
                         img_detail["likely_chart"] = True
-                        content["metadata"]["has_charts"] = True
+                        metadata["has_charts"] = True
                     else:
                         img_detail["likely_chart"] = False
                     
-                    content["images"]["details"].append(img_detail)
+                    image_details.append(img_detail)
                     print(f" 💾 Imagem salva: {img_file}")
                     pix = None
                     
                 except Exception as e:
                     print(f"❌ Erro ao processar imagem {i}: {e}")
-                    content["images"]["details"].append({
+                    image_details.append({
                         "index": i + 1, 
                         "error": str(e)
                     })
@@ -165,114 +269,128 @@ class PDFToMarkdownExtractor:
 
         # 4. DETECTAR TABELAS (baseado em padrões de texto)
         try:
-            text_lines = content["text"]["raw_text"].split('\n')
+            raw_text = text_info["raw_text"]
             potential_tables = []
             
+            # Pré-filtro na página inteira (uma busca em C): sem tab nem sequência
+            # de números não há linha candidata e o laço por linha é dispensado
+            has_candidates = '\t' in raw_text or _TABLE_RE.search(raw_text)
+            text_lines = raw_text.split('\n') if has_candidates else []
+            
             for i, line in enumerate(text_lines):
                 # Detectar linhas com múltiplos números separados por espaços/tabs
-                if re.search(r'\d+\s+\d+\s+\d+', line) or '\t' in line:
+                if '\t' in line or _TABLE_RE.search(line):
                     potential_tables.append({
                         "line_number": i + 1,
                         "content": line.strip()
                     })
             
             if potential_tables:
-                content["structure"]["tables"] = potential_tables
-                content["metadata"]["has_tables"] = True
+                structure["tables"] = potential_tables
+                metadata["has_tables"] = True
                 print(f"📊 Possíveis tabelas detectadas: {len(potential_tables)}")
 
         except Exception as e:
             print(f"❌ Erro na detecção de tabelas: {e}")
 
         # 5. CLASSIFICAR TIPO DE CONTEÚDO
-        if content["metadata"]["has_charts"]:
-            content["metadata"]["content_type"] = "chart"
-        elif content["metadata"]["has_tables"]:
-            content["metadata"]["content_type"] = "table"
-        elif len(content["structure"]["headings"]) > 0:
-            content["metadata"]["content_type"] = "structured_document"
+        if metadata["has_charts"]:
+            metadata["content_type"] = "chart"
+        elif metadata["has_tables"]:
+            metadata["content_type"] = "table"
+        elif len(headings) > 0:
+            metadata["content_type"] = "structured_document"
         else:
-            content["metadata"]["content_type"] = "text"
+            metadata["content_type"] = "text"
 
-        print(f"📋 Tipo de conteúdo: {content['metadata']['content_type']}")
+        print(f"📋 Tipo de conteúdo: {metadata['content_type']}")
         return content
 
     @staticmethod
-    def generate_markdown(extracted_data: dict, doc_name: str) -> str:
-        """Gerar markdown estruturado a partir dos dados extraídos."""
+    def summary_stats(pages) -> dict:
+        """Totais do documento (resumo executivo e estatísticas finais), numa passada pelas páginas."""
+        stats = {"total_words": 0, "total_images": 0, "chart_pages": 0, "table_pages": 0}
+        for page in pages:
+            stats["total_words"] += page["text"]["word_count"]
+            stats["total_images"] += page["images"]["count"]
+            stats["chart_pages"] += page["metadata"]["has_charts"]
+            stats["table_pages"] += page["metadata"]["has_tables"]
+        return stats
+
+    @staticmethod
+    def generate_markdown(extracted_data: dict, doc_name: str, out=None, stats: dict = None):
+        """Gerar markdown estruturado a partir dos dados extraídos.
+        
+        Grava direto em out (arquivo aberto em modo texto), sem montar o markdown em memória;
+        sem out, devolve o markdown como str. stats (ver summary_stats) evita recalcular
+        os totais quando quem chama já os tem.
+        """
+        if out is None:
+            buffer = io.StringIO()
+            PDFToMarkdownExtractor.generate_markdown(extracted_data, doc_name, buffer, stats)
+            return buffer.getvalue()
         
-        md_content = []
+        if stats is None:
+            stats = PDFToMarkdownExtractor.summary_stats(extracted_data["pages"].values())
         
         # Cabeçalho do documento
-        md_content.append(f"# {doc_name}")
-        md_content.append(f"**Extraído em:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
-        md_content.append(f"**Total de páginas:** {len(extracted_data['pages'])}")
-        md_content.append("")
+        out.write(f"# {doc_name}\n")
+        out.write(f"**Extraído em:** {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
+        out.write(f"**Total de páginas:** {len(extracted_data['pages'])}\n\n")
         
         # Resumo executivo
-        md_content.append("## Resumo Executivo")
-        md_content.append("")
+        out.write("## Resumo Executivo\n\n")
         
-        total_words = sum(page["text"]["word_count"] for page in extracted_data["pages"].values())
-        total_images = sum(page["images"]["count"] for page in extracted_data["pages"].values())
-        chart_pages = [p for p in extracted_data["pages"].values() if p["metadata"]["has_charts"]]
-        table_pages = [p for p in extracted_data["pages"].values() if p["metadata"]["has_tables"]]
-        
-        md_content.append(f"- **Palavras totais:** {total_words:,}")
-        md_content.append(f"- **Imagens totais:** {total_images}")
-        md_content.append(f"- **Páginas com gráficos:** {len(chart_pages)}")
-        md_content.append(f"- **Páginas com tabelas:** {len(table_pages)}")
-        md_content.append("")
+        out.write(f"- **Palavras totais:** {stats['total_words']:,}\n")
+        out.write(f"- **Imagens totais:** {stats['total_images']}\n")
+        out.write(f"- **Páginas com gráficos:** {stats['chart_pages']}\n")
+        out.write(f"- **Páginas com tabelas:** {stats['table_pages']}\n\n")
         
         # Conteúdo página por página
-        md_content.append("## Conteúdo por Página")
-        md_content.append("")
+        out.write("## Conteúdo por Página\n\n")
         
-        for page_key in sorted(extracted_data["pages"].keys(), key=lambda x: int(x.split('_')[1])):
-            page_data = extracted_data["pages"][page_key]
+        # Ordena pelo número da própria página: serve tanto para chaves inteiras
+        # quanto para as "page_N" de um JSON carregado, sem reinterpretar as chaves
+        for page_data in sorted(extracted_data["pages"].values(), key=lambda page: page["page_number"]):
             page_num = page_data["page_number"]
             
-            md_content.append(f"### Página {page_num}")
-            md_content.append("")
+            out.write(f"### Página {page_num}\n\n")
             
             # Metadados da página
-            md_content.append(f"**Tipo:** {page_data['metadata']['content_type']}")
-            md_content.append(f"**Palavras:** {page_data['text']['word_count']}")
-            md_content.append(f"**Imagens:** {page_data['images']['count']}")
-            md_content.append("")
+            out.write(f"**Tipo:** {page_data['metadata']['content_type']}\n")
+            out.write(f"**Palavras:** {page_data['text']['word_count']}\n")
+            out.write(f"**Imagens:** {page_data['images']['count']}\n\n")
             
             # Cabeçalhos detectados
             if page_data["structure"]["headings"]:
-                md_content.append("#### Cabeçalhos Detectados")
+                out.write("#### Cabeçalhos Detectados\n")
                 for heading in page_data["structure"]["headings"]:
-                    md_content.append(f"- {heading}")
-                md_content.append("")
+                    out.write(f"- {heading}\n")
+                out.write("\n")
             
             # Imagens
             if page_data["images"]["count"] > 0:
-                md_content.append("#### Imagens")
+                out.write("#### Imagens\n")
                 for img in page_data["images"]["details"]:
                     if "error" not in img:
                         chart_indicator = " 📊 (Possível gráfico)" if img.get("likely_chart", False) else ""
-                        md_content.append(f"- **Imagem {img['index']}:** {img['dimensions']} ({img['pixels']:,} pixels){chart_indicator}")
+                        out.write(f"- **Imagem {img['index']}:** {img['dimensions']} ({img['pixels']:,} pixels){chart_indicator}\n")
                         if "filename" in img:
-                            md_content.append(f"  - Arquivo: `{img['filename']}`")
-                md_content.append("")
+                            out.write(f"  - Arquivo: `{img['filename']}`\n")
+                out.write("\n")
             
             # Tabelas detectadas
             if page_data["structure"]["tables"]:
-                md_content.append("#### Tabelas Detectadas")
+                out.write("#### Tabelas Detectadas\n")
                 for table in page_data["structure"]["tables"][:5]:  # Mostrar apenas 5 primeiras
-                    md_content.append(f"```")
-                    md_content.append(table["content"])
-                    md_content.append(f"```")
+                    out.write(f"```\n{table['content']}\n```\n")
                 if len(page_data["structure"]["tables"]) > 5:
-                    md_content.append(f"*(... e mais {len(page_data['structure']['tables']) - 5} linhas)*")
-                md_content.append("")
+                    out.write(f"*(... e mais {len(page_data['structure']['tables']) - 5} linhas)*\n")
+                out.write("\n")
             
             # Texto da página (limitado para não ficar muito longo)
             if page_data["text"]["has_content"]:
-                md_content.append("#### Conteúdo Textual")
+                out.write("#### Conteúdo Textual\n")
                 text_content = page_data["text"]["raw_text"]
                 
                 # Limitar tamanho do texto exibido
@@ -280,18 +398,13 @@ class PDFToMarkdownExtractor:
                     text_content = text_content[:3000] + "\n\n*(... conteúdo truncado)*"
                 
                 # Preservar quebras de linha importantes
-                text_content = re.sub(r'\n\s*\n', '\n\n', text_content)
-                md_content.append("```")
-                md_content.append(text_content)
-                md_content.append("```")
-                md_content.append("")
+                text_content = _BLANKLINE_RE.sub('\n\n', text_content)
+                out.write(f"```\n{text_content}\n```\n\n")
             
-            md_content.append("---")
-            md_content.append("")
+            out.write("---\n\n")
         
         # Apêndices
-        md_content.append("## Apêndices")
-        md_content.append("")
+        out.write("## Apêndices\n")
         
         # Lista de todas as imagens extraídas
         all_images = []
@@ -299,16 +412,145 @@ class PDFToMarkdownExtractor:
             all_images.extend(page_data["images"]["extracted_paths"])
         
         if all_images:
-            md_content.append("### Imagens Extraídas")
+            out.write("\n### Imagens Extraídas\n")
             for img_path in all_images:
-                md_content.append(f"- `{img_path}`")
-            md_content.append("")
-        
-        return '\n'.join(md_content)
+                out.write(f"- `{img_path}`\n")
+
+
+def _save_json(path: Path, data: dict):
+    """Grava o JSON numa única serialização; default=str converte o que não for serializável."""
+    if ORJSON_AVAILABLE:
+        # orjson já entrega os bytes prontos: uma única escrita
+        path.write_bytes(orjson.dumps(data, option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS,
+                                      default=str))
+    else:
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, indent=2, ensure_ascii=False, default=str)
+
 
+def _submit_image_write(img_file: Path, data: bytes):
+    """Agenda a gravação de uma imagem; wait_image_writes espera as pendentes."""
+    global _image_writer
+    if _image_writer is None:
+        _image_writer = ThreadPoolExecutor(max_workers=os.cpu_count() or 1)
+    _pending_writes.append(_image_writer.submit(img_file.write_bytes, data))
 
-def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
-    """Extração completa de PDF para markdown."""
+
+def wait_image_writes():
+    """Espera as gravações de imagem pendentes e informa as que falharam."""
+    for future in _pending_writes:
+        try:
+            future.result()
+        except Exception as write_error:
+            print(f" ❌ Erro ao salvar imagem: {write_error}")
+    _pending_writes.clear()
+
+
+def prepare_image_dir() -> Path:
+    """Cria o diretório de imagens, uma única vez por extração."""
+    output_dir = Path("C:/extrair/extracted_images")
+    output_dir.mkdir(parents=True, exist_ok=True)
+    return output_dir
+
+
+def _first_image_occurrences(doc) -> dict:
+    """xref -> (página, índice) da primeira ocorrência de cada imagem do documento.
+    
+    Calculado no processo principal antes da extração (get_page_images só lê a
+    lista de imagens de cada página): a ocorrência que extrai e grava cada imagem
+    não depende de qual processo do pool pegou qual página.
+    """
+    first_images = {}
+    for page_num in range(len(doc)):
+        for i, img in enumerate(doc.get_page_images(page_num, full=True)):
+            first_images.setdefault(img[0], (page_num, i))
+    return first_images
+
+
+def _resolve_repeated_images(content: dict, page_firsts: list, first_details: dict,
+                             image_dir: Path):
+    """Completa os marcadores de imagem repetida com o detalhe da primeira ocorrência.
+    
+    page_firsts traz (índice, xref) das primeiras ocorrências desta página, cujos
+    detalhes entram em first_details. As páginas chegam em ordem, então a primeira
+    ocorrência de cada marcador já foi vista.
+    """
+    details = content["images"]["details"]
+    by_index = {detail["index"]: detail for detail in details}
+    for i, xref in page_firsts:
+        if i + 1 in by_index:
+            first_details[xref] = by_index[i + 1]
+    
+    resolved = False
+    for pos, detail in enumerate(details):
+        if "repeat_of" in detail:
+            details[pos] = dict(first_details[detail["repeat_of"]], index=detail["index"])
+            resolved = True
+            if details[pos].get("likely_chart"):
+                # Gráfico tem prioridade sobre os demais tipos de conteúdo
+                content["metadata"]["has_charts"] = True
+                content["metadata"]["content_type"] = "chart"
+    
+    if resolved:
+        # Caminhos na ordem das imagens, incluindo os arquivos reaproveitados
+        content["images"]["extracted_paths"] = [
+            str(image_dir / detail["filename"]) for detail in details
+            if "filename" in detail and "error" not in detail
+        ]
+
+
+def _init_page_worker(file_path: str, first_images: dict, image_dir: Path):
+    """Abre o PDF uma vez por processo do pool; o documento não pode ser enviado entre processos."""
+    global _worker_doc, _worker_first_images, _worker_image_dir
+    _worker_doc = fitz.open(file_path)
+    _worker_first_images = first_images
+    _worker_image_dir = image_dir
+
+
+def _extract_page_worker(page_num: int) -> dict:
+    """Extrai uma página usando o documento aberto neste processo."""
+    content = PDFToMarkdownExtractor.extract_page_content(_worker_doc, page_num, _worker_first_images,
+                                                          _worker_image_dir)
+    # O processo pode ser encerrado sem esperar threads: gravar antes de devolver
+    wait_image_writes()
+    return content
+
+
+def _iter_pages(doc, file_path: str, workers: int, image_dir: Path):
+    """Gera o conteúdo das páginas em ordem, em paralelo quando workers > 1.
+    
+    Imagens repetidas são extraídas só na primeira ocorrência e completadas aqui,
+    no processo principal: o resultado é o mesmo com qualquer número de workers.
+    """
+    first_images = _first_image_occurrences(doc)
+    firsts_by_page = {}
+    for xref, (page_num, i) in first_images.items():
+        firsts_by_page.setdefault(page_num, []).append((i, xref))
+    first_details = {}
+    
+    if workers > 1 and len(doc) > 1:
+        print(f"⚙️ Extraindo páginas em paralelo ({workers} processos)")
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                 initargs=(file_path, first_images, image_dir)) as executor:
+            # map devolve na ordem das páginas, conforme ficam prontas
+            for page_num, content in enumerate(executor.map(_extract_page_worker, range(len(doc)))):
+                _resolve_repeated_images(content, firsts_by_page.get(page_num, []), first_details,
+                                         image_dir)
+                yield content
+    else:
+        for page_num in range(len(doc)):
+            content = PDFToMarkdownExtractor.extract_page_content(doc, page_num, first_images, image_dir)
+            _resolve_repeated_images(content, firsts_by_page.get(page_num, []), first_details,
+                                     image_dir)
+            yield content
+
+
+def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair",
+                            workers: int = DEFAULT_WORKERS):
+    """Extração completa de PDF para markdown.
+    
+    Com workers > 1 as páginas são extraídas em paralelo, em processos separados.
+    """
     
     file_path = Path(file_path)
     output_dir = Path(output_dir)
@@ -331,28 +573,28 @@ def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
             "pages": {}
         }
         
-        # Extrair cada página
-        for page_num in range(len(doc)):
-            page_content = PDFToMarkdownExtractor.extract_page_content(doc, page_num)
-            page_key = f"page_{page_num + 1}"
-            extracted_data["pages"][page_key] = page_content
+        # Extrair cada página (chave: número da página, já em ordem; "page_N" só no JSON)
+        image_dir = prepare_image_dir()
+        for page_content in _iter_pages(doc, str(file_path), workers, image_dir):
+            extracted_data["pages"][page_content["page_number"]] = page_content
+        wait_image_writes()
         
-        # Gerar markdown
+        # Gerar markdown (totais calculados uma vez, usados também no resumo final)
         print(f"\n📝 Gerando markdown...")
-        markdown_content = PDFToMarkdownExtractor.generate_markdown(extracted_data, file_path.stem)
+        stats = PDFToMarkdownExtractor.summary_stats(extracted_data["pages"].values())
         
         # Salvar arquivos
-        # 1. Markdown principal
+        # 1. Markdown principal (gravado à medida que é gerado)
         md_file = output_dir / f"{file_path.stem}_extracted.md"
         with open(md_file, 'w', encoding='utf-8') as f:
-            f.write(markdown_content)
+            PDFToMarkdownExtractor.generate_markdown(extracted_data, file_path.stem, f, stats)
         print(f"💾 Markdown salvo: {md_file}")
         
         # 2. JSON com dados estruturados
         json_file = output_dir / f"{file_path.stem}_data.json"
-        clean_data = json.loads(json.dumps(extracted_data, default=str))
-        with open(json_file, 'w', encoding='utf-8') as f:
-            json.dump(clean_data, f, indent=2, ensure_ascii=False)
+        _save_json(json_file, dict(extracted_data, pages={
+            f"page_{page_number}": page for page_number, page in extracted_data["pages"].items()
+        }))
         print(f"💾 Dados JSON salvos: {json_file}")
         
         # 3. Arquivo de texto bruto (todas as páginas)
@@ -362,16 +604,15 @@ def extract_pdf_to_markdown(file_path: str, output_dir: str = "C:/extrair"):
             f.write(f"Data: {datetime.datetime.now()}\n")
             f.write("="*80 + "\n\n")
             
-            for page_key in sorted(extracted_data["pages"].keys(), key=lambda x: int(x.split('_')[1])):
-                page_data = extracted_data["pages"][page_key]
+            for page_data in extracted_data["pages"].values():
                 f.write(f"\n--- PÁGINA {page_data['page_number']} ---\n\n")
                 f.write(page_data["text"]["raw_text"])
                 f.write("\n\n")
         print(f"💾 Texto bruto salvo: {txt_file}")
         
         # Resumo final
-        total_words = sum(page["text"]["word_count"] for page in extracted_data["pages"].values())
-        total_images = sum(page["images"]["count"] for page in extracted_data["pages"].values())
+        total_words = stats["total_words"]
+        total_images = stats["total_images"]
         
         print(f"\n✅ EXTRAÇÃO CONCLUÍDA!")
         print(f"📊 Estatísticas:")
@@ -392,24 +633,39 @@ def main():
     """Função principal."""
     print("🚀 Extrator PDF para Markdown")
     
-    if len(sys.argv) < 2:
+    args = sys.argv[1:]
+    
+    # Opção --workers N (processos para extrair páginas em paralelo)
+    workers = DEFAULT_WORKERS
+    if "--workers" in args:
+        idx = args.index("--workers")
+        try:
+            workers = int(args[idx + 1])
+        except (IndexError, ValueError):
+            print("❌ --workers requer um número inteiro")
+            return
+        del args[idx:idx + 2]
+    
+    if len(args) < 1:
         print("\n💡 COMO USAR:")
         print(" python pdf_extractor.py <arquivo.pdf>")
         print(" python pdf_extractor.py <arquivo.pdf> <diretorio_saida>")
+        print(f" python pdf_extractor.py <arquivo.pdf> --workers N  # N processos (padrão: {DEFAULT_WORKERS})")
         print("\nExemplos:")
         print(" python pdf_extractor.py documento.pdf")
         print(" python pdf_extractor.py documento.pdf C:/minha_pasta")
+        print(" python pdf_extractor.py documento.pdf --workers 1")
         return
 
-    pdf_file = sys.argv[1]
-    output_dir = sys.argv[2] if len(sys.argv) > 2 else "C:/extrair"
+    pdf_file = args[0]
+    output_dir = args[1] if len(args) > 1 else "C:/extrair"
     
     if not Path(pdf_file).exists():
         print(f"❌ Arquivo não encontrado: {pdf_file}")
         return
     
     # Executar extração
-    extract_pdf_to_markdown(pdf_file, output_dir)
+    extract_pdf_to_markdown(pdf_file, output_dir, workers=workers)
 
 
 if __name__ == "__main__":